@@ -0,0 +1,254 @@
+"""Benchmarks of reading, writing and gather access.
+
+Run from the repository root::
+
+    python benchmarks/run.py --ns 1000 --ntr 100000 --gather-size 120
+    python benchmarks/run.py --shuffled --workers 1 2 4 --only read
+
+Besides reading and writing, ``import`` times a fresh interpreter importing
+the package and ``gather_lookup`` the label and position lookups of
+``gather``/``igather`` (reported as traces/s, one per lookup).
+
+Each benchmark is timed ``--repeat`` times (best and median are reported),
+then run once more under tracemalloc to record its peak Python/NumPy
+memory. Throughput is given in MB/s of SU data and traces/s.
+
+Results are printed as a table and appended as one JSON line per run to
+``--output`` (``bench_output.txt`` by default), together with the git
+revision and the parameters, so runs can be compared over time.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fs.memoryfs import MemoryFS  # noqa: E402
+
+from seismicio import readsu, readsuInMemory, writesu, writesuInMemory, iter_gathers  # noqa: E402
+from seismicio.Models.SuDataModel import SuFile  # noqa: E402
+from synthetic import make_su_file  # noqa: E402
+
+
+def benchmarks(path, file_size, args):
+    """Benchmark cases as (name, setup), where setup() returns the function
+    to time and the number of traces and bytes it processes."""
+    ntr = args.ntr
+    gather_keyword = 'fldr'
+    sort = args.shuffled
+
+    def read():
+        return lambda: readsu(path), ntr, file_size
+
+    def open_mmap():
+        return lambda: readsu(path, mmap=True), ntr, file_size
+
+    def read_workers(workers):
+        return lambda: readsu(path, workers=workers), ntr, file_size
+
+    def read_headers_only():
+        return lambda: readsu(path, headers_only=True), ntr, ntr * 240
+
+    def read_in_memory():
+        mem_fs = MemoryFS()
+        with open(path, 'rb') as file, mem_fs.open('bench.su', 'wb') as mem_file:
+            mem_file.write(file.read())
+        return lambda: readsuInMemory(mem_fs, 'bench.su'), ntr, file_size
+
+    def write():
+        sufile = readsu(path)
+        out_path = f'{path}.out'
+        return lambda: writesu(out_path, sufile.data, sufile.headers), ntr, file_size
+
+    def write_in_memory():
+        sufile = readsu(path)
+        mem_fs = MemoryFS()
+        return (
+            lambda: writesuInMemory(mem_fs, 'out.su', sufile.data, sufile.headers),
+            ntr,
+            file_size,
+        )
+
+    def gather_index():
+        sufile = readsu(path)
+        return (
+            lambda: SuFile(sufile.data, sufile.headers, gather_keyword, sort=sort),
+            ntr,
+            ntr * 240,
+        )
+
+    def igather_sequential():
+        sufile = readsu(path, gather_keyword, sort=sort)
+
+        def run():
+            for i in range(len(sufile.gather_index)):
+                np.asarray(sufile.igather[i].data)
+        return run, ntr, file_size
+
+    def gather_random_from(sufile):
+        # 200 gathers picked at random, read in that order
+        values = sufile.gather_index.values
+        picks = np.random.default_rng(0).choice(values, size=min(len(values), 200))
+        traces = len(picks) * args.gather_size
+
+        def run():
+            for value in picks:
+                np.asarray(sufile.gather[value].data)
+        return run, traces, traces * file_size // max(ntr, 1)
+
+    def gather_random():
+        return gather_random_from(readsu(path, gather_keyword, sort=sort))
+
+    def gather_random_mmap():
+        return gather_random_from(readsu(path, gather_keyword, mmap=True, sort=sort))
+
+    def import_package():
+        # A fresh interpreter importing the package, as a short CLI job does
+        command = [sys.executable, '-c', 'import seismicio']
+        return lambda: subprocess.run(command, cwd=REPO_ROOT, check=True), 0, 0
+
+    def gather_lookup():
+        # Label and position lookups only (the data is not read); traces/s
+        # is lookups/s
+        sufile = readsu(path, gather_keyword, mmap=True, sort=sort)
+        values = sufile.gather_index.values
+        picks = np.random.default_rng(0).choice(values, size=10000)
+        positions = [sufile.gather_value_to_index(value) for value in picks]
+
+        def run():
+            for value, position in zip(picks, positions):
+                sufile.gather[value]
+                sufile.igather[position]
+        return run, 2 * len(picks), 0
+
+    def iter_all_gathers():
+        def run():
+            for gather in iter_gathers(path, gather_keyword):
+                gather.data
+        return run, ntr, file_size
+
+    cases = [
+        ('import', import_package),
+        ('read', read),
+        ('open_mmap', open_mmap),
+        ('read_headers_only', read_headers_only),
+        ('read_in_memory', read_in_memory),
+    ]
+    cases += [
+        (f'read_workers_{workers}', lambda workers=workers: read_workers(workers))
+        for workers in args.workers
+    ]
+    cases += [
+        ('write', write),
+        ('write_in_memory', write_in_memory),
+        ('gather_index', gather_index),
+        ('igather_sequential', igather_sequential),
+        ('gather_random', gather_random),
+        ('gather_random_mmap', gather_random_mmap),
+        ('gather_lookup', gather_lookup),
+    ]
+    if not args.shuffled:
+        cases.append(('iter_gathers', iter_all_gathers))
+    return cases
+
+
+def measure(setup, repeat):
+    func, traces, nbytes = setup()
+    func()  # warm up (page cache, lazy imports)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    return {
+        'best_s': best,
+        'median_s': statistics.median(times),
+        'mb_per_s': nbytes / best / 1e6 if best else float('inf'),
+        'traces_per_s': traces / best if best else float('inf'),
+        'peak_mb': peak / 1e6,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ns', type=int, default=1000, help='samples per trace')
+    parser.add_argument('--ntr', type=int, default=50000, help='number of traces')
+    parser.add_argument('--gather-size', type=int, default=120, help='traces per gather (fldr)')
+    parser.add_argument('--shuffled', action='store_true', help='traces not sorted by fldr')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help='thread counts of the read_workers benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='run the benchmarks whose names start with these prefixes')
+    parser.add_argument('--dir', help='directory of the synthetic file (default: a temporary directory)')
+    parser.add_argument('--output', default=os.path.join(REPO_ROOT, 'bench_output.txt'))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, 'bench.su')
+        file_size = make_su_file(path, args.ns, args.ntr, args.gather_size, args.shuffled)
+
+        results = {}
+        print(f"{'benchmark':<22}{'best s':>10}{'median s':>10}{'MB/s':>10}{'traces/s':>12}{'peak MB':>10}")
+        for name, setup in benchmarks(path, file_size, args):
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            # Keep the table readable if the code under test prints
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(setup, args.repeat)
+            results[name] = result
+            print(
+                f"{name:<22}{result['best_s']:>10.4f}{result['median_s']:>10.4f}"
+                f"{result['mb_per_s']:>10.1f}{result['traces_per_s']:>12.0f}{result['peak_mb']:>10.1f}"
+            )
+
+    record = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'params': {
+            'ns': args.ns,
+            'ntr': args.ntr,
+            'gather_size': args.gather_size,
+            'shuffled': args.shuffled,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'a') as output:
+        output.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
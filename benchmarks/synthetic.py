@@ -0,0 +1,52 @@
+"""Synthetic SU files for the benchmarks.
+
+Files are written block by block, so files larger than memory can be
+generated. The headers describe a 2D shot line:
+
+- ``fldr``: shot number, ``gather_size`` traces per shot.
+- ``offset``, ``sx``, ``gx`` and ``cdp``: regular geometry of each shot.
+- ``tracl``: trace number in the file.
+
+With ``shuffled=True`` the traces of all shots are shuffled, so the file is
+not sorted by ``fldr`` (gathers need ``sort=True``).
+"""
+import numpy as np
+
+from seismicio.Models.UtilsModel import Utils
+
+
+def make_su_file(path, ns, ntr, gather_size=120, shuffled=False, dt=4000, seed=0):
+    """Write a synthetic SU file of ``ntr`` traces of ``ns`` samples.
+
+    Returns:
+      The size of the file in bytes.
+    """
+    rng = np.random.default_rng(seed)
+    trace_dtype = Utils.trace_dtype(ns)
+    trace_order = rng.permutation(ntr) if shuffled else np.arange(ntr)
+    time = np.arange(ns, dtype=np.float32)[None, :] * (dt / 1e6)
+
+    chunk_traces = Utils.get_chunk_traces(trace_dtype.itemsize)
+    with open(path, 'wb') as file:
+        for start in range(0, ntr, chunk_traces):
+            stop = min(start + chunk_traces, ntr)
+            shot_trace = trace_order[start:stop]
+            records = np.zeros(stop - start, dtype=trace_dtype)
+            header = records['header']
+            header['tracl'] = np.arange(start, stop) + 1
+            header['fldr'] = shot_trace // gather_size + 1
+            header['tracf'] = shot_trace % gather_size + 1
+            header['offset'] = header['tracf'] * 25
+            header['sx'] = header['fldr'] * 50
+            header['gx'] = header['sx'] + header['offset']
+            header['cdp'] = (header['sx'] + header['gx']) // 50
+            header['ns'] = ns
+            header['dt'] = dt
+
+            # A dipping event plus noise, so samples are not trivially
+            # compressible
+            delay = (header['offset'][:, None] / 2000.0).astype(np.float32)
+            records['data'] = np.sin(2 * np.pi * 25 * (time - delay)) * np.exp(-time)
+            records['data'] += 0.01 * rng.standard_normal((stop - start, ns), dtype=np.float32)
+            file.write(memoryview(records).cast('B'))
+    return ntr * trace_dtype.itemsize
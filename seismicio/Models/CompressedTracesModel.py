@@ -0,0 +1,103 @@
+import threading
+import numpy as np
+
+
+class CompressedTraces:
+    """Read-only (num_samples, num_traces) trace data of a compressed SU
+    container, decompressed on access.
+
+    Indexing it like the data array of an SuFile (e.g. ``data[:, start:stop]``
+    or ``data[:, trace_indices]``) returns a regular array, decompressing
+    only the chunks that hold the selected traces. Converting it to an array
+    (``np.asarray``) decompresses every chunk.
+
+    Attributes:
+      shape (tuple): (num_samples, num_traces).
+      dtype: Sample data type (float32).
+      chunk_start (ndarray): Index of the first trace of each chunk, followed
+        by the number of traces.
+      compressed_nbytes (int): Bytes of the compressed sample chunks.
+    """
+
+    ndim = 2
+
+    def __init__(self, file, num_samples, chunk_start, chunk_offset, chunk_length, decompress):
+        self.shape = (num_samples, int(chunk_start[-1]))
+        self.dtype = np.dtype(np.float32)
+        self.chunk_start = chunk_start
+        self.compressed_nbytes = int(np.sum(chunk_length))
+        self._file = file
+        self._chunk_offset = chunk_offset
+        self._chunk_length = chunk_length
+        self._decompress = decompress
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    @property
+    def T(self):
+        return np.asarray(self).T
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        traces_data = self.read_traces(0, self.shape[1]).T
+        return traces_data if dtype is None else traces_data.astype(dtype, copy=False)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        samples = key[0]
+        traces = key[1] if len(key) > 1 else slice(None)
+
+        if isinstance(traces, slice) and traces.step in (None, 1):
+            start, stop, _ = traces.indices(self.shape[1])
+            return self.read_traces(start, max(start, stop)).T[samples]
+        trace_indices = np.arange(self.shape[1])[traces]
+        if trace_indices.ndim == 0:
+            return self.read_traces(int(trace_indices), int(trace_indices) + 1)[0][samples]
+        return self.take_traces(trace_indices).T[samples]
+
+    def read_chunk(self, chunk):
+        """Decompressed traces of a chunk, as (num_traces, num_samples)."""
+        with self._lock:
+            self._file.seek(int(self._chunk_offset[chunk]))
+            compressed = self._file.read(int(self._chunk_length[chunk]))
+        return self._decompress(compressed, np.float32).reshape(-1, self.shape[0])
+
+    def read_traces(self, start, stop):
+        """Traces ``start`` to ``stop`` as (num_traces, num_samples)."""
+        out = np.empty((stop - start, self.shape[0]), dtype=self.dtype)
+        if stop <= start:
+            return out
+        first = int(np.searchsorted(self.chunk_start, start, side='right')) - 1
+        last = int(np.searchsorted(self.chunk_start, stop, side='left'))
+        for chunk in range(first, last):
+            chunk_start = int(self.chunk_start[chunk])
+            chunk_traces = self.read_chunk(chunk)
+            # Part of the chunk inside [start, stop)
+            begin = max(start, chunk_start)
+            end = min(stop, chunk_start + len(chunk_traces))
+            out[begin - start:end - start] = chunk_traces[begin - chunk_start:end - chunk_start]
+        return out
+
+    def take_traces(self, trace_indices):
+        """The given traces as (num_traces, num_samples), decompressing each
+        chunk they touch once."""
+        out = np.empty((len(trace_indices), self.shape[0]), dtype=self.dtype)
+        chunks = np.searchsorted(self.chunk_start, trace_indices, side='right') - 1
+        for chunk in np.unique(chunks).tolist():
+            mask = chunks == chunk
+            out[mask] = self.read_chunk(chunk)[trace_indices[mask] - self.chunk_start[chunk]]
+        return out
+
+    def close(self):
+        """Close the container file."""
+        self._file.close()
@@ -0,0 +1,257 @@
+import os
+import tempfile
+import numpy as np
+
+from .UtilsModel import Utils
+from .InOutSuModel import InOutSu
+from .GatherIndexModel import GatherIndex
+from .SuzModel import Suz
+from ..constants.HEADER_DTYPE import HEADER_DTYPE
+
+
+class ExternalSort:
+    """Sort the traces of an SU file by header keys with bounded memory.
+
+    The sort runs in three steps:
+
+    1. Only the headers are scanned, to get the sort keys of every trace.
+    2. The sort permutation is computed in memory when the key index fits in
+       the memory budget. Otherwise sorted runs of the index are spilled to
+       temporary files next to the output and merged block by block.
+    3. The output is written in blocks of traces. The traces of each block
+       are read from the mapped input in file order, copying each run of
+       consecutive traces as one slice.
+
+    Within equal keys, traces keep their input order.
+    """
+
+    # Bytes per trace needed to sort the key index in memory: the keys and
+    # trace index, plus the lexsort and gather temporaries
+    INDEX_OVERHEAD = 3
+
+    # Smallest memory budget used, so that tiny limits do not turn the sort
+    # into a huge number of runs merged a few records at a time
+    MIN_MEMORY_LIMIT = 1024 * 1024
+
+    # Fewest index records read from each run per merge step
+    MIN_MERGE_TRACES = 1024
+
+    # Average run of consecutive traces below which a block is gathered
+    # trace by trace instead of copied run by run
+    MIN_RUN_TRACES = 8
+
+    @staticmethod
+    def run(in_path, out_path, keys, memory_limit=None, sidecar=False):
+        if isinstance(keys, str):
+            keys = [keys]
+        keys = list(keys)
+        if memory_limit is not None:
+            memory_limit = max(memory_limit, ExternalSort.MIN_MEMORY_LIMIT)
+        if os.path.exists(out_path) and os.path.samefile(in_path, out_path):
+            raise ValueError("sortsu cannot sort a file in place")
+
+        with open(in_path, 'rb') as file:
+            if Suz.is_suz(file):
+                raise ValueError(
+                    "sortsu cannot sort a compressed SU container; read it with readsu "
+                    "and write it with writesu first"
+                )
+            trace_dtype, traces_amount = InOutSu.read_layout(file)
+        if memory_limit is None:
+            block_traces = Utils.get_chunk_traces(trace_dtype.itemsize)
+        else:
+            # Read buffer plus its reordered copy
+            block_traces = max(1, memory_limit // (2 * trace_dtype.itemsize))
+        block_traces = min(block_traces, max(traces_amount, 1))
+
+        index_dtype = ExternalSort.index_dtype(keys)
+        index_size = ExternalSort.INDEX_OVERHEAD * index_dtype.itemsize
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as run_dir:
+            if memory_limit is None or traces_amount * index_size <= memory_limit:
+                blocks = ExternalSort.sorted_blocks(in_path, keys, block_traces)
+            else:
+                run_traces = max(1, memory_limit // index_size)
+                run_paths = ExternalSort.spill_runs(
+                    in_path, trace_dtype, traces_amount, keys, run_traces, run_dir
+                )
+                blocks = ExternalSort.merged_blocks(
+                    run_paths, keys, block_traces, memory_limit, run_dir
+                )
+
+            gather_index = ExternalSort.write_blocks(
+                in_path, out_path, trace_dtype, blocks, block_traces, keys[0]
+            )
+
+        if sidecar:
+            GatherIndex.save(out_path, {keys[0]: gather_index})
+        return gather_index
+
+    @staticmethod
+    def index_dtype(keys):
+        # Sort keys of a trace followed by its index in the input file
+        return np.dtype([(key, HEADER_DTYPE[key].newbyteorder('=')) for key in keys] + [('trace', np.int64)])
+
+    @staticmethod
+    def lexsort(index):
+        # Permutation sorting index records by their keys, then trace index
+        names = index.dtype.names
+        return np.lexsort([index[name] for name in reversed(names)])
+
+    @staticmethod
+    def sorted_blocks(in_path, keys, block_traces):
+        # Sort the whole key index in memory, yielding the trace indices and
+        # first key of each output block
+        header_records = InOutSu.map_su_headers(in_path, keys)
+        order = np.lexsort([header_records[key] for key in reversed(keys)])
+        first_key = header_records[keys[0]]
+        for start in range(0, len(order), block_traces):
+            trace_indices = order[start:start + block_traces]
+            yield trace_indices, first_key[trace_indices]
+
+    @staticmethod
+    def spill_runs(in_path, trace_dtype, traces_amount, keys, run_traces, run_dir):
+        # Sort the key index in runs of run_traces traces, each one saved to
+        # its own file
+        header_records = np.memmap(
+            in_path, dtype=trace_dtype, mode='r', shape=(traces_amount,)
+        )['header']
+        run_paths = []
+        for start in range(0, traces_amount, run_traces):
+            block = header_records[start:start + run_traces]
+            index = np.empty(len(block), dtype=ExternalSort.index_dtype(keys))
+            for key in keys:
+                index[key] = block[key]
+            index['trace'] = np.arange(start, start + len(block))
+            run_path = os.path.join(run_dir, f'run{len(run_paths)}.npy')
+            np.save(run_path, index[ExternalSort.lexsort(index)])
+            run_paths.append(run_path)
+        return run_paths
+
+    @staticmethod
+    def merged_blocks(run_paths, keys, block_traces, memory_limit, run_dir):
+        # Merge the sorted runs, yielding the trace indices and first key of
+        # each output block. Runs are merged at most fan_in at a time, so that
+        # each run is read in blocks of at least MIN_MERGE_TRACES records;
+        # with more runs, groups of them are first merged into longer runs
+        index_size = ExternalSort.INDEX_OVERHEAD * ExternalSort.index_dtype(keys).itemsize
+        fan_in = max(2, memory_limit // (index_size * ExternalSort.MIN_MERGE_TRACES))
+        while len(run_paths) > fan_in:
+            merged_paths = []
+            for group_start in range(0, len(run_paths), fan_in):
+                group = run_paths[group_start:group_start + fan_in]
+                merged_path = os.path.join(run_dir, f'run{len(run_paths)}-{group_start}.npy')
+                ExternalSort.merge_to_file(group, merged_path, memory_limit)
+                for run_path in group:
+                    os.remove(run_path)
+                merged_paths.append(merged_path)
+            run_paths = merged_paths
+
+        for merged in ExternalSort.merge_runs(run_paths, memory_limit):
+            for start in range(0, len(merged), block_traces):
+                block = merged[start:start + block_traces]
+                yield block['trace'], block[keys[0]]
+
+    @staticmethod
+    def merge_to_file(run_paths, merged_path, memory_limit):
+        # Merge sorted runs into one longer run file
+        runs = [np.load(run_path, mmap_mode='r') for run_path in run_paths]
+        merged_run = np.lib.format.open_memmap(
+            merged_path, mode='w+', dtype=runs[0].dtype, shape=(sum(len(run) for run in runs),)
+        )
+        position = 0
+        for merged in ExternalSort.merge_runs(run_paths, memory_limit):
+            merged_run[position:position + len(merged)] = merged
+            position += len(merged)
+        merged_run.flush()
+        del merged_run
+
+    @staticmethod
+    def merge_runs(run_paths, memory_limit):
+        # Merge sorted run files, yielding consecutive chunks of the merged
+        # order. Every step takes a block from each run and emits all the
+        # records up to the smallest last record of those blocks, which are
+        # the next records of the merged order
+        runs = [np.load(run_path, mmap_mode='r') for run_path in run_paths]
+        positions = [0] * len(runs)
+        index_size = ExternalSort.INDEX_OVERHEAD * runs[0].dtype.itemsize
+        merge_traces = max(1, memory_limit // (index_size * len(runs)))
+        while True:
+            active = [number for number, run in enumerate(runs) if positions[number] < len(run)]
+            if not active:
+                return
+            heads = [
+                np.array(runs[number][positions[number]:positions[number] + merge_traces])
+                for number in active
+            ]
+            lasts = np.concatenate([head[-1:] for head in heads])
+            cutoff = lasts[ExternalSort.lexsort(lasts)[0]]
+
+            taken = []
+            for number, head in zip(active, heads):
+                count = int(np.count_nonzero(ExternalSort.less_equal(head, cutoff)))
+                taken.append(head[:count])
+                positions[number] += count
+            merged = np.concatenate(taken)
+            yield merged[ExternalSort.lexsort(merged)]
+
+    @staticmethod
+    def less_equal(index, cutoff):
+        # Whether each index record sorts before or equal to cutoff, comparing
+        # fields in order
+        less = np.zeros(len(index), dtype=bool)
+        equal = np.ones(len(index), dtype=bool)
+        for name in index.dtype.names:
+            less |= equal & (index[name] < cutoff[name])
+            equal &= index[name] == cutoff[name]
+        return less | equal
+
+    @staticmethod
+    def read_traces(traces, records, trace_indices):
+        # Copy the given (sorted, unique) traces of the mapped input into
+        # records, in file order. Runs of consecutive traces are copied as
+        # single slices (one sequential read each); when the runs are too
+        # short for that to pay off, the traces are gathered in one pass
+        run_starts, run_stops = Utils.trace_runs(trace_indices)
+        if len(run_starts) * ExternalSort.MIN_RUN_TRACES > len(trace_indices):
+            np.take(traces, trace_indices, out=records)
+            return
+        for run_start, run_stop in zip(run_starts, run_stops):
+            first = int(trace_indices[run_start])
+            records[run_start:run_stop] = traces[first:first + run_stop - run_start]
+
+    @staticmethod
+    def write_blocks(in_path, out_path, trace_dtype, blocks, block_traces, gather_keyword):
+        # Write the output block by block, and build the gather index of
+        # gather_keyword for the new trace order on the way
+        read_buffer = np.empty(block_traces, dtype=trace_dtype)
+        write_buffer = np.empty(block_traces, dtype=trace_dtype)
+        starts = []
+        values = []
+        last_value = None
+        position = 0
+        traces_amount = os.path.getsize(in_path) // trace_dtype.itemsize
+        traces = np.memmap(in_path, dtype=trace_dtype, mode='r', shape=(traces_amount,))
+        with open(out_path, 'wb') as out_file:
+            for trace_indices, gather_values in blocks:
+                # Read the block in file order, then put it in output order
+                read_order = np.argsort(trace_indices, kind='stable')
+                records = read_buffer[:len(trace_indices)]
+                ExternalSort.read_traces(traces, records, trace_indices[read_order])
+                output_records = write_buffer[:len(trace_indices)]
+                output_records[read_order] = records
+                out_file.write(memoryview(output_records).cast('B'))
+
+                changes = np.flatnonzero(gather_values[1:] != gather_values[:-1]) + 1
+                if last_value is None or gather_values[0] != last_value:
+                    changes = np.concatenate(([0], changes))
+                starts.append(changes + position)
+                values.append(gather_values[changes])
+                last_value = gather_values[-1]
+                position += len(trace_indices)
+
+        if not starts:
+            empty = np.zeros(0, dtype=np.intp)
+            return GatherIndex(empty, empty, np.zeros(0, dtype=HEADER_DTYPE[gather_keyword]))
+        start = np.concatenate(starts)
+        stop = np.concatenate((start[1:], [position]))
+        return GatherIndex(start, stop, np.concatenate(values))
@@ -0,0 +1,162 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .UtilsModel import Utils
+from .GatherIndexModel import GatherIndex
+
+
+class GatherCache:
+    """Least recently used cache of gather data, bounded by a byte budget.
+
+    Meant for disk-backed (memory-mapped) files accessed gather by gather in
+    random order, e.g. by viewers or data loaders. Cached data is a read-only
+    copy of the gather traces.
+
+    After a miss on a single gather, the ``readahead`` gathers on each side of
+    it are loaded in a background thread, so that moving to a neighbouring
+    gather is usually a hit. Readahead gathers are cached as used just before
+    that miss, so they never evict it or any gather accessed after it.
+    Call ``close`` to stop the readahead thread.
+
+    Attributes:
+      max_bytes (int): Byte budget of the cached gather data.
+      readahead (int): Number of adjacent gathers loaded on each side after
+        a miss.
+      nbytes (int): Bytes of gather data currently cached.
+      hits (int): Accesses served from the cache (or from a readahead that
+        was in progress).
+      misses (int): Accesses that had to read the gather.
+      evictions (int): Gathers dropped to stay within the byte budget.
+    """
+
+    def __init__(self, data, gather_index: GatherIndex, max_bytes: int, readahead: int = 0):
+        self.max_bytes = max_bytes
+        self.readahead = readahead
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = data
+        self._gather_index = gather_index
+        self._entries = OrderedDict()  # (start, stop) -> data, oldest first
+        self._stamps = {}  # (start, stop) -> access count of its last use
+        self._clock = 0
+        self._pending = {}  # (start, stop) -> readahead future
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def stats(self) -> dict:
+        """Counters of the cache, to tune its byte budget."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "num_gathers": len(self._entries),
+        }
+
+    def clear(self):
+        """Drop all cached gathers, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._stamps.clear()
+            self.nbytes = 0
+
+    def close(self):
+        """Stop the readahead thread (cancelling pending readaheads) and drop
+        all cached gathers."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.clear()
+
+    def get(self, start: int, stop: int):
+        """Data of the traces from position ``start`` to ``stop`` of the
+        gather index, from the cache if possible."""
+        key = (start, stop)
+        with self._lock:
+            self._clock += 1
+            stamp = self._clock
+            if key in self._entries:
+                self._touch(key, stamp)
+                self.hits += 1
+                return self._entries[key]
+            future = self._pending.get(key)
+
+        if future is not None:
+            gather_data = future.result()
+            with self._lock:
+                self.hits += 1
+                if key in self._entries:
+                    self._touch(key, stamp)
+            return gather_data
+
+        with self._lock:
+            self.misses += 1
+        gather_data = self._load(key, stamp)
+        self._readahead(start, stop, stamp)
+        return gather_data
+
+    def _touch(self, key, stamp):
+        self._stamps[key] = stamp
+        self._entries.move_to_end(key)
+
+    def _load(self, key, stamp):
+        start, stop = key
+        if self._gather_index.order is None:
+            gather_data = np.array(self._data[:, start:stop])
+        else:
+            gather_data = Utils.take_traces(self._data, self._gather_index.order[start:stop])
+        gather_data.flags.writeable = False
+        self._store(key, gather_data, stamp)
+        return gather_data
+
+    def _store(self, key, gather_data, stamp):
+        # Entries stay ordered by stamp: a readahead entry (stamped just
+        # before the miss that triggered it) goes before that miss and the
+        # entries used since, so the evictions it causes only reach older
+        # entries, or itself
+        with self._lock:
+            self._pending.pop(key, None)
+            if gather_data.nbytes > self.max_bytes or key in self._entries:
+                return
+            newer = []
+            for entry_key in reversed(self._entries):
+                if self._stamps[entry_key] <= stamp:
+                    break
+                newer.append(entry_key)
+            self._entries[key] = gather_data
+            self._stamps[key] = stamp
+            for entry_key in reversed(newer):
+                self._entries.move_to_end(entry_key)
+            self.nbytes += gather_data.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                del self._stamps[evicted_key]
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def _readahead(self, start, stop, stamp):
+        if not self.readahead:
+            return
+        starts = self._gather_index.start
+        position = int(np.searchsorted(starts, start))
+        if position >= len(starts) or starts[position] != start or self._gather_index.stop[position] != stop:
+            return  # not a single gather
+
+        first = max(position - self.readahead, 0)
+        last = min(position + self.readahead, len(starts) - 1)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            for neighbour in range(first, last + 1):
+                key = (int(starts[neighbour]), int(self._gather_index.stop[neighbour]))
+                if neighbour == position or key in self._entries or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._load, key, stamp - 0.5)
@@ -0,0 +1,200 @@
+import logging
+import os
+import tempfile
+import zipfile
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class GatherIndex:
+    """Start/stop trace positions of each gather, labeled by gather value.
+
+    Attributes:
+      start (ndarray): Index of the first trace of each gather.
+      stop (ndarray): Index after the last trace of each gather.
+      values (ndarray): Gather keyword value of each gather.
+      order (ndarray): Trace permutation that groups the gathers, for traces
+        not sorted by the gather keyword. When set, start and stop are
+        positions in this permutation rather than trace indices. None for
+        sorted traces.
+    """
+
+    def __init__(self, start, stop, values, order=None):
+        self.start = start
+        self.stop = stop
+        self.values = values
+        self.order = order
+        self._positions = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def position(self, value) -> int:
+        """Position of the gather with the given value (the first one, if
+        several gathers have it).
+
+        Values are looked up by binary search when they are increasing (sorted
+        traces, or ``sort=True``), otherwise in a dict built on first use.
+
+        Raises:
+          KeyError: No gather has this value.
+        """
+        if self._positions is None:
+            values = self.values
+            if len(values) < 2 or bool(np.all(values[1:] > values[:-1])):
+                self._positions = values
+            else:
+                self._positions = {}
+                for position, gather_value in enumerate(values.tolist()):
+                    self._positions.setdefault(gather_value, position)
+
+        if isinstance(self._positions, dict):
+            return self._positions[value]
+        position = int(np.searchsorted(self._positions, value))
+        if position == len(self._positions) or self._positions[position] != value:
+            raise KeyError(value)
+        return position
+
+    @staticmethod
+    def from_keys(separation_key, sort=False):
+        """Find the gathers of traces grouped by a header keyword.
+
+        A new gather starts wherever the keyword value differs from the one
+        of the previous trace.
+
+        Args:
+          separation_key: Keyword value of every trace, in file order.
+          sort: Whether to group the traces through a stable sort
+            permutation first, for traces not sorted by the keyword. Traces
+            keep their file order within each gather.
+        """
+        separation_key = np.asarray(separation_key)
+        order = None
+        if sort:
+            order = np.argsort(separation_key, kind="stable")
+            separation_key = separation_key[order]
+
+        num_traces = len(separation_key)
+        if num_traces == 0:
+            empty = np.zeros(0, dtype=np.intp)
+            return GatherIndex(empty, empty, separation_key[:0], order)
+
+        changes = np.flatnonzero(separation_key[1:] != separation_key[:-1]) + 1
+        start = np.concatenate(([0], changes))
+        stop = np.concatenate((changes, [num_traces]))
+        return GatherIndex(start, stop, separation_key[start], order)
+
+    @staticmethod
+    def _table_name(gather_keyword, sort):
+        return f"{gather_keyword}.sorted" if sort else gather_keyword
+
+    # Sidecar index file
+    # ------------------
+
+    @staticmethod
+    def sidecar_path(file_path):
+        """Path of the gather index file stored next to an SU file."""
+        return f"{os.fspath(file_path)}.gidx.npz"
+
+    @staticmethod
+    def _file_signature(file_path):
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _load_sidecar(file_path):
+        """Read all tables of a sidecar, or an empty dict if it is missing,
+        unreadable (e.g. truncated, or not a sidecar) or does not match the
+        current size and mtime of the SU file."""
+        try:
+            with np.load(GatherIndex.sidecar_path(file_path), allow_pickle=False) as sidecar:
+                arrays = dict(sidecar)
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            return {}
+        if "file_size" not in arrays or "file_mtime_ns" not in arrays:
+            return {}
+        signature = (int(arrays.pop("file_size")), int(arrays.pop("file_mtime_ns")))
+        if signature != GatherIndex._file_signature(file_path):
+            return {}
+        return arrays
+
+    @staticmethod
+    def load(file_path, gather_keyword, sort=False):
+        """Load the gather index of a keyword from the sidecar of an SU file.
+
+        Args:
+          file_path: Path of the SU file.
+          gather_keyword: Header keyword that comprises the gathers.
+          sort: Whether to load the index built with a sort permutation.
+
+        Returns:
+          The GatherIndex, or None if the sidecar is missing, stale or does not
+          hold the given keyword.
+        """
+        arrays = GatherIndex._load_sidecar(file_path)
+        name = GatherIndex._table_name(gather_keyword, sort)
+        if f"{name}.start" not in arrays:
+            return None
+        return GatherIndex(
+            arrays[f"{name}.start"],
+            arrays[f"{name}.stop"],
+            arrays[f"{name}.values"],
+            arrays.get(f"{name}.order"),
+        )
+
+    @staticmethod
+    def save(file_path, gather_indices):
+        """Store gather indices in the sidecar of an SU file.
+
+        Tables for other keywords already in a valid sidecar are kept.
+
+        Args:
+          file_path: Path of the SU file the indices were built from.
+          gather_indices: Dict of GatherIndex by gather keyword.
+        """
+        arrays = GatherIndex._load_sidecar(file_path)
+        for gather_keyword, gather_index in gather_indices.items():
+            name = GatherIndex._table_name(gather_keyword, gather_index.order is not None)
+            arrays[f"{name}.start"] = gather_index.start
+            arrays[f"{name}.stop"] = gather_index.stop
+            arrays[f"{name}.values"] = gather_index.values
+            if gather_index.order is not None:
+                arrays[f"{name}.order"] = gather_index.order
+        file_size, file_mtime_ns = GatherIndex._file_signature(file_path)
+
+        # Write to a temporary file of its own first, so readers never see a
+        # partial index and concurrent writers do not overwrite each other
+        path = GatherIndex.sidecar_path(file_path)
+        directory, name = os.path.split(path)
+        with tempfile.NamedTemporaryFile(
+            dir=directory or ".", prefix=f"{name}.", suffix=".tmp", delete=False
+        ) as sidecar:
+            temporary_path = sidecar.name
+            try:
+                np.savez(sidecar, file_size=file_size, file_mtime_ns=file_mtime_ns, **arrays)
+            except BaseException:
+                sidecar.close()
+                os.remove(temporary_path)
+                raise
+        try:
+            os.replace(temporary_path, path)
+        except OSError:
+            os.remove(temporary_path)
+            raise
+
+    @staticmethod
+    def try_save(file_path, gather_indices):
+        """Store gather indices in the sidecar of an SU file, as ``save``, but
+        only log a warning if it cannot be written (e.g. a read-only
+        directory), since the indices are only a cache.
+
+        Returns:
+          Whether the sidecar was written.
+        """
+        try:
+            GatherIndex.save(file_path, gather_indices)
+        except OSError as error:
+            logger.warning("Could not save the gather index of %s: %s", file_path, error)
+            return False
+        return True
@@ -0,0 +1,96 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .SharedArrayModel import SharedArray
+from .SuDataModel import SuFile, Header, GatherView
+
+# Arrays attached once by each worker process of GatherMap.run
+_worker = {}
+
+
+class GatherMap:
+    """Apply a function to every gather of an SuFile, over a process pool.
+
+    Input data, header columns, output data and the trace order of unsorted
+    gathers are shared with the workers (memory-mapped files directly,
+    anything else through shared memory), so only (start, stop) gather
+    ranges are sent to them.
+    """
+
+    @staticmethod
+    def run(sufile: SuFile, func, workers: int, out: SuFile = None):
+        if sufile.gather_keyword is None:
+            raise ValueError("map_gathers needs an SuFile with a gather_keyword")
+
+        if out is None:
+            headers = Header(np.array(sufile.headers.records))
+            out = SuFile(
+                np.zeros(sufile.data.shape, dtype=np.float32),
+                headers,
+                sufile.gather_keyword,
+                sufile.gather_index,
+            )
+
+        ranges = list(zip(sufile.gather_index.start.tolist(), sufile.gather_index.stop.tolist()))
+        trace_order = sufile.gather_index.order
+        if workers <= 1:
+            for start, stop in ranges:
+                GatherMap.apply(func, sufile.data, sufile.headers, out.data, trace_order, start, stop)
+            return out
+
+        shared_data = SharedArray.share(sufile.data)
+        shared_headers = SharedArray.share(sufile.headers.records)
+        shared_out = SharedArray.share(out.data)
+        shared_order = None if trace_order is None else SharedArray.share(trace_order)
+        try:
+            # A few tasks per worker, each one a batch of gather ranges
+            tasks = np.array_split(np.arange(len(ranges)), workers * 4)
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=GatherMap._init_worker,
+                initargs=(func, shared_data, shared_headers, shared_out, shared_order),
+            ) as executor:
+                batches = [[ranges[i] for i in task] for task in tasks if len(task)]
+                # Consume the results so that worker errors are raised here
+                list(executor.map(GatherMap._run_batch, batches))
+            if shared_out.file_path is None:
+                out.data[...] = shared_out.attach()
+        finally:
+            for shared in (shared_data, shared_headers, shared_out, shared_order):
+                if shared is not None:
+                    shared.release()
+        return out
+
+    @staticmethod
+    def apply(func, data, headers, out_data, trace_order, start, stop):
+        # Run func on one gather and store its result for the same traces
+        result = func(GatherView(start, stop, data, headers, trace_order))
+        if result is None:
+            return
+        if trace_order is None:
+            out_data[:, start:stop] = result
+        else:
+            out_data[:, trace_order[start:stop]] = result
+
+    @staticmethod
+    def _init_worker(func, shared_data, shared_headers, shared_out, shared_order):
+        _worker["func"] = func
+        _worker["data"] = shared_data.attach()
+        _worker["headers"] = Header(shared_headers.attach())
+        _worker["out"] = shared_out.attach()
+        _worker["trace_order"] = None if shared_order is None else shared_order.attach()
+        # Keep the handles alive, as the arrays use their buffers
+        _worker["shared"] = (shared_data, shared_headers, shared_out, shared_order)
+
+    @staticmethod
+    def _run_batch(ranges):
+        for start, stop in ranges:
+            GatherMap.apply(
+                _worker["func"],
+                _worker["data"],
+                _worker["headers"],
+                _worker["out"],
+                _worker["trace_order"],
+                start,
+                stop,
+            )
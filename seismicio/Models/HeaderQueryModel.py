@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class HeaderQuery:
+    """Find the traces whose headers meet a set of conditions.
+
+    Conditions are given per header keyword:
+    - A single value, e.g. ``cdp=2000``: traces with that value.
+    - A ``(low, high)`` tuple, e.g. ``offset=(500, 1500)``: traces with a
+      value in that range, both ends included. Either end may be None.
+      Tuples of any other length are rejected.
+    - A list, set or array of values, e.g. ``fldr=[10, 12]``: traces with any
+      of those values.
+    - A function of the header column returning a boolean mask, e.g.
+      ``sx=lambda sx: sx % 25 == 0``.
+
+    Single values and ranges are answered by binary search on a sorted index
+    of the keyword, built the first time it is queried and kept for later
+    queries. The most selective of them gives the candidate traces; the
+    other conditions are only evaluated on those candidates.
+    """
+
+    def __init__(self, headers):
+        self._headers = headers
+        self._sorted_indexes = {}  # keyword -> (order, sorted values)
+
+    def select(self, **conditions):
+        """Indices of the traces meeting all conditions, in file order."""
+        indexed = {}
+        masked = {}
+        for key, condition in conditions.items():
+            bounds = HeaderQuery._bounds(key, condition)
+            if bounds is None:
+                masked[key] = condition
+            else:
+                indexed[key] = bounds
+
+        # Trace ranges in the sorted index of each indexed keyword
+        positions = {key: self._positions(key, *bounds) for key, bounds in indexed.items()}
+        if positions:
+            narrowest = min(positions, key=lambda key: positions[key][1] - positions[key][0])
+            first, last = positions.pop(narrowest)
+            order, _ = self._sorted_indexes[narrowest]
+            trace_indices = np.sort(order[first:last])
+        else:
+            num_traces = len(self._headers)
+            trace_indices = np.arange(num_traces)
+
+        for key in positions:
+            low, high = indexed[key]
+            values = self._headers[key][trace_indices]
+            mask = np.ones(len(trace_indices), dtype=bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            trace_indices = trace_indices[mask]
+
+        for key, condition in masked.items():
+            values = self._headers[key][trace_indices]
+            if callable(condition):
+                mask = np.asarray(condition(values), dtype=bool)
+            else:
+                mask = np.isin(values, np.asarray(list(condition)))
+            trace_indices = trace_indices[mask]
+        return trace_indices
+
+    @staticmethod
+    def _bounds(key, condition):
+        # (low, high) for single values and ranges, None for other conditions
+        if isinstance(condition, tuple):
+            if len(condition) != 2:
+                raise ValueError(
+                    f"Range condition of {key!r} must be a (low, high) tuple, got {condition!r}; "
+                    "use a list for a set of values"
+                )
+            low, high = condition
+            return low, high
+        if callable(condition) or isinstance(condition, (list, set, frozenset, np.ndarray)):
+            return None
+        return condition, condition
+
+    def _positions(self, key, low, high):
+        if key not in self._sorted_indexes:
+            column = self._headers[key]
+            order = np.argsort(column, kind="stable")
+            self._sorted_indexes[key] = (order, column[order])
+        _, sorted_values = self._sorted_indexes[key]
+        first = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        last = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        return int(first), int(max(first, last))
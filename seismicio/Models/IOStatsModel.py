@@ -0,0 +1,126 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class IOStats:
+    """Timings and byte counts of reads and writes, to find where the time
+    of a slow job goes.
+
+    Pass an instance as ``stats`` to ``readsu``, ``writesu`` and the other
+    read/write functions; each call adds to it. Phases are timed separately:
+
+    - ``total``: the whole call.
+    - ``read`` / ``write``: waiting for the file (disk or page cache).
+    - ``headers``: copying header records.
+    - ``samples``: converting and transposing samples to/from the data matrix.
+    - ``map``: memory-mapping a file.
+    - ``compress`` / ``decompress``: compressing or decompressing a
+      compressed SU container.
+    - ``gather_index``: finding the gathers of the gather keyword.
+    - ``gather_indices_df``: building the ``gather_indices_df`` DataFrame.
+
+    With several worker threads, phase times are summed over the threads.
+    Without ``stats``, the read/write paths use a disabled instance whose
+    methods do nothing.
+
+    Attributes:
+      phases (dict): Seconds spent in each phase.
+      bytes_read (int): Bytes read from files.
+      bytes_written (int): Bytes written to files.
+      traces_read (int): Traces read.
+      traces_written (int): Traces written.
+      callback: Optional function called as ``callback(phase, seconds)``
+        each time a phase ends, e.g. to feed a profiler or metrics system.
+    """
+
+    DISABLED = None  # set below
+
+    def __init__(self, callback=None, enabled=True):
+        self.phases = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.traces_read = 0
+        self.traces_written = 0
+        self.callback = callback
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._disabled_phase = nullcontext()
+
+    @staticmethod
+    def get(stats):
+        """The given stats, or the disabled instance if None."""
+        return IOStats.DISABLED if stats is None else stats
+
+    def phase(self, name):
+        """Context manager timing a phase."""
+        if not self.enabled:
+            return self._disabled_phase
+        return _Phase(self, name)
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def add_read(self, nbytes, traces=0):
+        if self.enabled:
+            with self._lock:
+                self.bytes_read += nbytes
+                self.traces_read += traces
+
+    def add_written(self, nbytes, traces=0):
+        if self.enabled:
+            with self._lock:
+                self.bytes_written += nbytes
+                self.traces_written += traces
+
+    @property
+    def traces_per_second(self):
+        """Traces read and written per second of ``total`` time."""
+        total = self.phases.get('total', 0.0)
+        return (self.traces_read + self.traces_written) / total if total else 0.0
+
+    @property
+    def megabytes_per_second(self):
+        """MB read and written per second of ``total`` time."""
+        total = self.phases.get('total', 0.0)
+        return (self.bytes_read + self.bytes_written) / total / 1e6 if total else 0.0
+
+    def as_dict(self):
+        """All counters and phase times, e.g. to log them as JSON."""
+        return {
+            'phases': dict(self.phases),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'traces_read': self.traces_read,
+            'traces_written': self.traces_written,
+            'traces_per_second': self.traces_per_second,
+            'megabytes_per_second': self.megabytes_per_second,
+        }
+
+    def __repr__(self):
+        phases = ', '.join(f'{name}={seconds:.4f}s' for name, seconds in self.phases.items())
+        return (
+            f'IOStats({phases}; read {self.bytes_read} B / {self.traces_read} traces, '
+            f'written {self.bytes_written} B / {self.traces_written} traces)'
+        )
+
+
+class _Phase:
+    __slots__ = ('_stats', '_name', '_start')
+
+    def __init__(self, stats, name):
+        self._stats = stats
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.add_phase(self._name, time.perf_counter() - self._start)
+
+
+IOStats.DISABLED = IOStats(enabled=False)
@@ -1,21 +1,70 @@
 import struct
 import numpy as np
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 
 from .UtilsModel import Utils
-from .SuDataModel import SuFile, Header
-from ..constants.HEADER_FORMAT_STRING import HEADER_FORMAT_STRING
+from .SuDataModel import SuFile, Header, GatherView
+from .IOStatsModel import IOStats
 from ..constants.TRACE_HEADER_SIZE import TRACE_HEADER_SIZE
 from ..constants.HEADER_KEYS import HEADER_KEYS
+from ..constants.HEADER_DTYPE import HEADER_DTYPE
 
 # https://docs.python.org/3/library/struct.html#format-strings
 class InOutSu():
     @staticmethod
-    def unpack_su(file, gather_keyword=None):
+    def read_samples_amount(file, byteorder='<'):
         # Read number of samples (how many values a trace has)
         file.seek(114)  # change stream position to byte 114
         bytes_to_unpack = file.read(2)  # read 2 bytes
-        trace_samples_amount = struct.unpack('<H', bytes_to_unpack)[0]
+        return struct.unpack(f'{byteorder}H', bytes_to_unpack)[0]
+
+    @staticmethod
+    def read_byteorder(file):
+        # Byte order of an open file: '<' (little-endian) or '>' (big-endian,
+        # e.g. from SU installations on big-endian machines). The ns of the
+        # first trace is decoded both ways, and an order is plausible if its
+        # ns splits the file into whole traces. When both are, the order
+        # whose ns and dt are found again at byte 114 of the second and last
+        # traces (with its own trace size) is taken. If both (or neither)
+        # orders are plausible, the file is taken as little-endian
+        file_size = Utils.get_file_size(file)
+        file.seek(114)
+        ns_dt = file.read(4)
+        if len(ns_dt) < 4:
+            return '<'
+        plausible = []
+        for byteorder in ('<', '>'):
+            ns = struct.unpack(f'{byteorder}H', ns_dt[:2])[0]
+            if ns > 0 and file_size % (TRACE_HEADER_SIZE + 4 * ns) == 0:
+                plausible.append(byteorder)
+        if len(plausible) == 2:
+            plausible = [
+                byteorder for byteorder in plausible
+                if InOutSu._repeats_ns_dt(file, file_size, byteorder, ns_dt)
+            ]
+        file.seek(0)
+        return plausible[0] if len(plausible) == 1 else '<'
+
+    @staticmethod
+    def _repeats_ns_dt(file, file_size, byteorder, ns_dt):
+        # Whether the second and last traces, at the trace size given by the
+        # ns of the first trace in this byte order, have its ns and dt bytes
+        ns = struct.unpack(f'{byteorder}H', ns_dt[:2])[0]
+        trace_size = TRACE_HEADER_SIZE + 4 * ns
+        traces_amount = file_size // trace_size
+        for trace_index in {min(1, traces_amount - 1), traces_amount - 1}:
+            file.seek(trace_index * trace_size + 114)
+            if file.read(4) != ns_dt:
+                return False
+        return True
+
+    @staticmethod
+    def read_layout(file):
+        # Trace record dtype and number of traces of an open file. The dtype
+        # has the byte order of the file, so big-endian files are decoded by
+        # NumPy as they are copied (or accessed, when memory-mapped)
+        byteorder = InOutSu.read_byteorder(file)
+        trace_samples_amount = InOutSu.read_samples_amount(file, byteorder)
 
         file_size = Utils.get_file_size(file)
 
@@ -23,60 +72,326 @@ class InOutSu():
         trace_data_size = trace_samples_amount * 4
         traces_amount = file_size // (trace_data_size + TRACE_HEADER_SIZE)
 
-        traces_data = np.zeros(shape=(trace_samples_amount, traces_amount), dtype=np.float32)
-        headers = Utils.new_empty_header(traces_amount)
+        return Utils.trace_dtype(trace_samples_amount, byteorder), traces_amount
 
-        data_format_string = f'{trace_samples_amount}f'
+    @staticmethod
+    def read_record_blocks(file, trace_dtype, traces_amount, chunk_traces=None, reuse_buffer=True, stats=None):
+        # Read whole traces (header + samples) from the start of the file in
+        # large blocks of structured records, yielding (start, records). With
+        # reuse_buffer, each block overwrites the previous one.
+        stats = IOStats.get(stats)
+        if chunk_traces is None:
+            chunk_traces = Utils.get_chunk_traces(trace_dtype.itemsize)
+        chunk_traces = min(chunk_traces, max(traces_amount, 1))
+        buffer = np.empty(chunk_traces, dtype=trace_dtype) if reuse_buffer else None
         file.seek(0)
-        for index in range(traces_amount):
-            # Read trace header
-            header_bytes = file.read(TRACE_HEADER_SIZE)
-            header_values = struct.unpack_from(HEADER_FORMAT_STRING, header_bytes)
-
-            for key, value in zip(HEADER_KEYS, header_values):
-                headers[key][index] = value
-
-            # Read data trace
-            data_bytes = file.read(trace_data_size)
-            traces_data[:, index] = np.array(
-                struct.unpack(data_format_string, data_bytes),
-                dtype=np.float32
+        for start in range(0, traces_amount, chunk_traces):
+            count = min(chunk_traces, traces_amount - start)
+            if reuse_buffer:
+                records = buffer[:count]
+            else:
+                records = np.empty(count, dtype=trace_dtype)
+            with stats.phase('read'):
+                Utils.read_into(file, records)
+            stats.add_read(records.nbytes, count)
+            yield start, records
+
+    @staticmethod
+    def unpack_su(file, gather_keyword=None, gather_index=None, sort=False, order='C', stats=None):
+        # order='F' stores each trace contiguously (trace-major), which makes
+        # loading, gather slices and writing back contiguous copies
+        trace_dtype, traces_amount = InOutSu.read_layout(file)
+        trace_samples_amount = trace_dtype['data'].shape[0]
+
+        traces_data = np.zeros(
+            shape=(trace_samples_amount, traces_amount), dtype=np.float32, order=order
+        )
+        header_records = np.empty(traces_amount, dtype=HEADER_DTYPE)
+
+        # Split each block of records into samples and header records, with
+        # no per-trace Python work
+        blocks = InOutSu.read_record_blocks(file, trace_dtype, traces_amount, stats=stats)
+        for start, records in blocks:
+            InOutSu.unpack_records(records, traces_data, header_records, start, stats)
+        return SuFile(traces_data, Header(header_records), gather_keyword, gather_index, sort, stats)
+
+    @staticmethod
+    def unpack_su_parallel(
+        file_path, workers, gather_keyword=None, gather_index=None, sort=False, order='C', stats=None
+    ):
+        # Same result as unpack_su, but the traces are split into one range
+        # per worker thread. Each thread fills its part of the shared data
+        # matrix and header columns with positional reads, so no thread
+        # depends on a shared file position
+        stats = IOStats.get(stats)
+        with open(file_path, 'rb') as file:
+            trace_dtype, traces_amount = InOutSu.read_layout(file)
+            trace_samples_amount = trace_dtype['data'].shape[0]
+
+            traces_data = np.zeros(
+                shape=(trace_samples_amount, traces_amount), dtype=np.float32, order=order
+            )
+            header_records = np.empty(traces_amount, dtype=HEADER_DTYPE)
+
+            # Split the read budget between workers
+            chunk_traces = max(1, Utils.get_chunk_traces(trace_dtype.itemsize) // workers)
+            bounds = np.linspace(0, traces_amount, workers + 1).astype(int)
+
+            def unpack_range(start, stop):
+                buffer = np.empty(min(chunk_traces, max(stop - start, 1)), dtype=trace_dtype)
+                for block_start in range(start, stop, chunk_traces):
+                    records = buffer[:min(chunk_traces, stop - block_start)]
+                    offset = block_start * trace_dtype.itemsize
+                    with stats.phase('read'):
+                        Utils.pread_into(file.fileno(), records, offset)
+                    stats.add_read(records.nbytes, len(records))
+                    InOutSu.unpack_records(records, traces_data, header_records, block_start, stats)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Consume the results so that worker errors are raised here
+                list(executor.map(unpack_range, bounds[:-1], bounds[1:]))
+        return SuFile(traces_data, Header(header_records), gather_keyword, gather_index, sort, stats)
+
+    @staticmethod
+    def new_header_records(keys, traces_amount):
+        # Empty header records holding only the given keys, or whole SU
+        # header records if keys is None
+        if keys is None:
+            return np.empty(traces_amount, dtype=HEADER_DTYPE)
+        return np.empty(traces_amount, dtype=[(key, HEADER_DTYPE[key]) for key in keys])
+
+    @staticmethod
+    def unpack_su_headers(file, keys=None, stats=None):
+        # Read only the headers of a file that cannot be memory-mapped (e.g.
+        # of an in-memory file system), as header records holding the given
+        # keys (all of them if None). Whole traces are read, but only the
+        # requested fields are decoded
+        stats = IOStats.get(stats)
+        trace_dtype, traces_amount = InOutSu.read_layout(file)
+        header_records = InOutSu.new_header_records(keys, traces_amount)
+        blocks = InOutSu.read_record_blocks(file, trace_dtype, traces_amount, stats=stats)
+        for start, records in blocks:
+            with stats.phase('headers'):
+                InOutSu.unpack_header_records(records['header'], header_records, start)
+        return header_records
+
+    @staticmethod
+    def map_su_headers(file_path, keys=None, stats=None):
+        # Read only the headers through a memory mapping, so the sample pages
+        # between headers are never read (unless a page is shared with a
+        # header, i.e. for traces smaller than a page)
+        with open(file_path, 'rb') as file:
+            trace_dtype, traces_amount = InOutSu.read_layout(file)
+        header_records = InOutSu.new_header_records(keys, traces_amount)
+        if traces_amount == 0:
+            return header_records
+
+        stats = IOStats.get(stats)
+        with stats.phase('map'):
+            mapped_records = np.memmap(
+                file_path, dtype=trace_dtype, mode='r', shape=(traces_amount,)
+            )['header']
+        chunk_traces = Utils.get_chunk_traces(trace_dtype.itemsize)
+        with stats.phase('headers'):
+            for start in range(0, traces_amount, chunk_traces):
+                InOutSu.unpack_header_records(
+                    mapped_records[start:start + chunk_traces], header_records, start
+                )
+        stats.add_read(traces_amount * TRACE_HEADER_SIZE, traces_amount)
+        return header_records
+
+    @staticmethod
+    def unpack_header_records(source_records, header_records, start):
+        # Copy a block of SU header records into header records holding all
+        # or some of the keys, starting at trace index `start`
+        stop = start + len(source_records)
+        if header_records.dtype.names == source_records.dtype.names:
+            Utils.copy_records(header_records[start:stop], source_records)
+            return
+        for key in header_records.dtype.names:
+            header_records[key][start:stop] = source_records[key]
+
+    @staticmethod
+    def map_su(file_path, gather_keyword=None, writable=False, gather_index=None, sort=False, stats=None):
+        # Memory-map the file instead of reading it: data and header columns
+        # are views over the mapping, so pages are only read when touched
+        with open(file_path, 'rb') as file:
+            trace_dtype, traces_amount = InOutSu.read_layout(file)
+
+        with IOStats.get(stats).phase('map'):
+            records = np.memmap(
+                file_path,
+                dtype=trace_dtype,
+                mode='r+' if writable else 'r',
+                shape=(traces_amount,),
             )
-        return SuFile(traces_data, Header(**headers), gather_keyword)
-    
+
+        traces_data = records['data'].T
+        return SuFile(traces_data, Header(records['header']), gather_keyword, gather_index, sort, stats)
+
     @staticmethod
-    def pack_and_save_su(file, traces_data, hdr):
+    def unpack_su_window(
+        file_path,
+        sample_range=None,
+        trace_range=None,
+        trace_step=1,
+        gather_keyword=None,
+        sort=False,
+        order='C',
+        stats=None,
+    ):
+        # Read a window of the file: samples sample_range[0] to
+        # sample_range[1] of every trace_step-th trace from trace_range[0] to
+        # trace_range[1] (half-open ranges, as Python slices). The file is
+        # mapped and only the selected records are copied, so only the pages
+        # holding their headers and samples are read
+        with open(file_path, 'rb') as file:
+            trace_dtype, traces_amount = InOutSu.read_layout(file)
+        trace_samples_amount = trace_dtype['data'].shape[0]
+
+        first_sample, stop_sample = sample_range or (None, None)
+        first_sample, stop_sample, _ = slice(first_sample, stop_sample).indices(trace_samples_amount)
+        window_samples = max(stop_sample - first_sample, 0)
+        first_trace, stop_trace = trace_range or (None, None)
+        trace_slice = slice(first_trace, stop_trace, trace_step)
+        window_traces = len(range(*trace_slice.indices(traces_amount)))
+
+        stats = IOStats.get(stats)
+        traces_data = np.zeros(shape=(window_samples, window_traces), dtype=np.float32, order=order)
+        header_records = np.empty(window_traces, dtype=HEADER_DTYPE)
+        if window_traces:
+            records = np.memmap(
+                file_path, dtype=trace_dtype, mode='r', shape=(traces_amount,)
+            )[trace_slice]
+            chunk_traces = Utils.get_chunk_traces(trace_dtype.itemsize)
+            for start in range(0, window_traces, chunk_traces):
+                block = records[start:start + chunk_traces]
+                stop = start + len(block)
+                with stats.phase('headers'):
+                    Utils.copy_records(header_records[start:stop], block['header'])
+                with stats.phase('samples'):
+                    traces_data[:, start:stop] = block['data'][:, first_sample:stop_sample].T
+            stats.add_read(header_records.nbytes + traces_data.nbytes, window_traces)
+
+        # Keep the headers consistent with the window: ns is the number of
+        # samples read, and the delay of the first sample moves with it
+        header_records['ns'] = window_samples
+        if first_sample:
+            delay = header_records['dt'].astype(np.int64) * first_sample // 1000
+            header_records['delrt'] = header_records['delrt'] + delay
+        return SuFile(traces_data, Header(header_records), gather_keyword, None, sort, stats)
+
+    @staticmethod
+    def iter_unpack_su(file, gather_keyword=None, chunk_traces=None, order='C'):
+        # Stream the file in blocks of `chunk_traces` traces, yielding each
+        # gather as soon as the trace that follows it has been read. Only the
+        # current block and the gather still being completed are kept in
+        # memory. Without a gather keyword, each block is yielded as is.
+        trace_dtype, traces_amount = InOutSu.read_layout(file)
+
+        pending = []  # record blocks of the gather not yet completed
+        pending_value = None
+        blocks = InOutSu.read_record_blocks(
+            file, trace_dtype, traces_amount, chunk_traces, reuse_buffer=False
+        )
+        for _, block in blocks:
+            if gather_keyword is None:
+                yield InOutSu.records_to_gather(block, order)
+                continue
+
+            separation_key = block['header'][gather_keyword]
+            separation_indices = np.flatnonzero(separation_key[1:] != separation_key[:-1]) + 1
+            if pending and pending_value != separation_key[0]:
+                separation_indices = np.concatenate(([0], separation_indices))
+
+            if separation_indices.size:
+                pending.append(block[:separation_indices[0]])
+                yield InOutSu.records_to_gather(np.concatenate(pending), order)
+                for gather_start, gather_stop in zip(separation_indices[:-1], separation_indices[1:]):
+                    yield InOutSu.records_to_gather(block[gather_start:gather_stop], order)
+                pending = [block[separation_indices[-1]:]]
+            else:
+                pending.append(block)
+            pending_value = separation_key[-1]
+
+        if pending:
+            yield InOutSu.records_to_gather(np.concatenate(pending), order)
+
+    @staticmethod
+    def records_to_gather(records, order='C'):
+        # Copy a block of trace records into a standalone gather
+        traces_amount = len(records)
+        trace_samples_amount = records.dtype['data'].shape[0]
+        traces_data = np.empty(
+            shape=(trace_samples_amount, traces_amount), dtype=np.float32, order=order
+        )
+        header_records = np.empty(traces_amount, dtype=HEADER_DTYPE)
+        InOutSu.unpack_records(records, traces_data, header_records, 0)
+        return GatherView(0, traces_amount, traces_data, Header(header_records))
+
+    @staticmethod
+    def unpack_records(records, traces_data, header_records, start, stats=None):
+        # Copy a block of trace records into the data matrix and header
+        # records, starting at trace index `start`
+        stats = IOStats.get(stats)
+        stop = start + len(records)
+        with stats.phase('headers'):
+            Utils.copy_records(header_records[start:stop], records['header'])
+        with stats.phase('samples'):
+            traces_data[:, start:stop] = records['data'].T
+
+    @staticmethod
+    def pack_records(records, traces_data, hdr, start, stats=None):
+        # Copy traces `start` onwards from the data matrix and headers into
+        # a block of trace records, ready to be written. Header records are
+        # copied as they are (swapped if the byte orders differ); other
+        # headers (e.g. the dict from Utils.new_empty_header) column by column
+        stats = IOStats.get(stats)
+        stop = start + len(records)
+        header_records = records['header']
+        with stats.phase('headers'):
+            source_records = InOutSu.header_records_range(hdr, start, stop)
+            if source_records is not None and Utils.is_header_dtype(source_records.dtype):
+                Utils.copy_records(header_records, source_records)
+            else:
+                for key in HEADER_KEYS:
+                    try:
+                        if source_records is not None and key in source_records.dtype.names:
+                            header_records[key] = source_records[key]
+                        else:
+                            header_records[key] = hdr[key][start:stop]
+                    except KeyError:
+                        # Keys missing from older header dicts are written as zero
+                        header_records[key] = 0
+        with stats.phase('samples'):
+            records['data'] = traces_data[:, start:stop].T
+
+    @staticmethod
+    def header_records_range(hdr, start, stop):
+        # Header records of traces start to stop of hdr, or None for headers
+        # without records (dicts of columns). Views of selected or sorted
+        # traces only copy the records of this range
+        records_range = getattr(hdr, 'records_range', None)
+        if records_range is not None:
+            return records_range(start, stop)
+        records = getattr(hdr, 'records', None)
+        return None if records is None else records[start:stop]
+
+    @staticmethod
+    def pack_and_save_su(file, traces_data, hdr, stats=None, byteorder='<'):
+        # hdr may be a Header or the dict from Utils.new_empty_header
+        stats = IOStats.get(stats)
         n_samples, n_traces = traces_data.shape
-        trace_data_size = n_samples * 4
-        data_format = f'{n_samples}f'
-
-        print(f'Number of samples: {n_samples}')
-        print(f'Number of traces: {n_traces}')
-
-        for i in range(n_traces):
-            # Write trace header
-            file.seek(Utils.get_header_position(i, trace_data_size))
-            header_bytes = struct.pack(
-                HEADER_FORMAT_STRING, hdr.tracl[i], hdr.tracr[i], hdr.fldr[i],
-                hdr.tracf[i], hdr.ep[i], hdr.cdp[i], hdr.cdpt[i], hdr.trid[i],
-                hdr.nvs[i], hdr.nhs[i], hdr.duse[i], hdr.offset[i],
-                hdr.gelev[i], hdr.selev[i], hdr.sdepth[i], hdr.gdel[i],
-                hdr.sdel[i], hdr.swdep[i], hdr.gwdep[i], hdr.scalel[i],
-                hdr.scalco[i], hdr.sx[i], hdr.sy[i], hdr.gx[i], hdr.gy[i],
-                hdr.counit[i], hdr.wevel[i], hdr.swevel[i], hdr.sut[i],
-                hdr.gut[i], hdr.sstat[i], hdr.gstat[i], hdr.tstat[i],
-                hdr.laga[i], hdr.lagb[i], hdr.delrt[i], hdr.muts[i],
-                hdr.mute[i], hdr.ns[i], hdr.dt[i], hdr.gain[i], hdr.igc[i],
-                hdr.igi[i], hdr.corr[i], hdr.sfs[i], hdr.sfe[i], hdr.slen[i],
-                hdr.styp[i], hdr.stas[i], hdr.stae[i], hdr.tatyp[i],
-                hdr.afilf[i], hdr.afils[i], hdr.nofilf[i], hdr.nofils[i],
-                hdr.lcf[i], hdr.hcf[i], hdr.lcs[i], hdr.hcs[i], hdr.year[i],
-                hdr.day[i], hdr.hour[i], hdr.minute[i], hdr.sec[i],
-                hdr.timbas[i], hdr.trwf[i], hdr.grnors[i], hdr.grnofr[i],
-                hdr.grnlof[i], hdr.gaps[i], hdr.otrav[i], hdr.d1[i], hdr.f1[i],
-                hdr.d2[i], hdr.f2[i], hdr.ungpow[i], hdr.unscale[i])
-            file.write(header_bytes)
-            # Write trace data
-            file.seek(Utils.get_data_position(i, trace_data_size))
-            data_bytes = struct.pack(data_format, *traces_data[:, i])
-            file.write(data_bytes)
\ No newline at end of file
+        trace_dtype = Utils.trace_dtype(n_samples, Utils.check_byteorder(byteorder))
+        chunk_traces = min(Utils.get_chunk_traces(trace_dtype.itemsize), max(n_traces, 1))
+
+        # Zeroed once, so the unassigned header bytes stay zero in every
+        # block written from header columns
+        buffer = np.zeros(chunk_traces, dtype=trace_dtype)
+        for start in range(0, n_traces, chunk_traces):
+            count = min(chunk_traces, n_traces - start)
+            records = buffer[:count]
+            InOutSu.pack_records(records, traces_data, hdr, start, stats)
+            with stats.phase('write'):
+                file.write(memoryview(records).cast('B'))
+            stats.add_written(records.nbytes, count)
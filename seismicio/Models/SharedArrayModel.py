@@ -0,0 +1,98 @@
+import mmap
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedArray:
+    """Picklable handle to an array that other processes can attach to.
+
+    Arrays that are views of a memory-mapped file are shared through the
+    file itself; any other array is copied once into a shared memory block.
+    Only the handle (names, shapes, offsets) is pickled when it is sent to a
+    worker process, never the array contents.
+    """
+
+    def __init__(self, shape, dtype, strides, offset, file_path=None, shm_name=None, writable=True):
+        self.shape = shape
+        self.dtype = dtype
+        self.strides = strides
+        self.offset = offset
+        self.file_path = file_path
+        self.shm_name = shm_name
+        self.writable = writable
+        self._shm = None
+        self._mapping = None
+
+    @staticmethod
+    def share(array):
+        """Make an array reachable from other processes.
+
+        Args:
+          array: The array to share.
+
+        Returns:
+          The SharedArray. Call ``release`` once workers are done with it.
+        """
+        file_path, file_offset, writable = SharedArray._memmap_location(array)
+        if file_path is not None:
+            return SharedArray(
+                array.shape, array.dtype, array.strides, file_offset, file_path, writable=writable
+            )
+
+        shared = SharedArray.empty(array.shape, array.dtype)
+        shared.attach()[...] = array
+        return shared
+
+    @staticmethod
+    def empty(shape, dtype):
+        """Allocate a zero-filled array in shared memory.
+
+        Returns:
+          The SharedArray. Call ``release`` once workers are done with it.
+        """
+        dtype = np.dtype(dtype)
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        shared = SharedArray(shape, dtype, None, 0, shm_name=shm.name)
+        shared._shm = shm
+        return shared
+
+    @staticmethod
+    def _memmap_location(array):
+        # File path and byte position of the first element of a view of a
+        # memory-mapped file, or (None, None, None) for any other array
+        mapping = getattr(array, "_mmap", None)
+        if not isinstance(array, np.memmap) or mapping is None or array.filename is None:
+            return None, None, None
+        if any(stride < 0 for stride in array.strides):
+            return None, None, None
+        mapping_address = np.frombuffer(mapping, dtype=np.uint8).ctypes.data
+        mapping_start = array.offset - array.offset % mmap.ALLOCATIONGRANULARITY
+        file_offset = mapping_start + array.ctypes.data - mapping_address
+        return array.filename, file_offset, array.flags.writeable and array.mode != "c"
+
+    def attach(self):
+        """Get the shared array in the current process, without copying."""
+        if self.file_path is not None:
+            if self._mapping is None:
+                self._mapping = np.memmap(
+                    self.file_path, dtype=np.uint8, mode="r+" if self.writable else "r"
+                )
+            return np.ndarray(
+                self.shape, self.dtype, buffer=self._mapping, offset=self.offset, strides=self.strides
+            )
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self.shm_name)
+        return np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+
+    def release(self):
+        """Free the shared memory block. Only the creating process calls it."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = None
+        state["_mapping"] = None
+        return state
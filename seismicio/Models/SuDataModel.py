@@ -1,99 +1,263 @@
-from types import SimpleNamespace
+import logging
+import operator
 import numpy as np
 import numpy.typing as npt
 from .UtilsModel import Utils
-import pandas as pd
+from .GatherIndexModel import GatherIndex
+from .GatherCacheModel import GatherCache
+from .HeaderQueryModel import HeaderQuery
+from .IOStatsModel import IOStats
+from ..constants.HEADER_DTYPE import HEADER_DTYPE
 
+logger = logging.getLogger(__name__)
+
+
+class Header:
+    """Trace headers, backed by one structured array of SU header records.
+
+    The records mirror the 240-byte SU trace header (``HEADER_DTYPE``), so
+    header bytes are read, sliced and written back without repacking.
+    Keyword access (``hdr.cdp``, ``hdr["offset"]``) returns a zero-copy view
+    of that field; assigning to a keyword sets the field values in place.
+
+    Keywords that are not fields of the records (e.g. added by the user) are
+    kept as separate arrays.
+    """
+
+    def __init__(self, records=None, **columns):
+        """Initialize the instance from header records or columns.
+
+        Args:
+          records: Structured array of header records. A zeroed array of
+            ``HEADER_DTYPE`` records is created if not given.
+          **columns: Header columns by keyword, copied into the records. If
+            they are exactly the fields of one structured array (e.g. from
+            ``Utils.new_empty_header``), that array is used without copies.
+        """
+        if records is None:
+            records = Header._shared_records(columns)
+            if records is not None:
+                columns = {}
+        if records is None:
+            num_traces = len(next(iter(columns.values()))) if columns else 0
+            records = np.zeros(num_traces, dtype=HEADER_DTYPE)
+        self.__dict__["_records"] = records
+        self.__dict__["_extra"] = {}
+        for key, column in columns.items():
+            self[key] = column
+
+    @staticmethod
+    def _shared_records(columns):
+        # The structured array all columns are field views of, if any.
+        # Columns may also be lists or other sequences, which are copied
+        if not columns:
+            return None
+        base = getattr(next(iter(columns.values())), "base", None)
+        if not isinstance(base, np.ndarray) or base.dtype.names is None:
+            return None
+        if set(columns) != set(base.dtype.names):
+            return None
+        for key, column in columns.items():
+            field = base[key]
+            if (
+                not isinstance(column, np.ndarray)
+                or column.base is not base
+                or column.dtype != field.dtype
+                or column.shape != field.shape
+                or column.ctypes.data != field.ctypes.data
+            ):
+                return None
+        return base
+
+    @property
+    def records(self):
+        """The structured array of header records."""
+        return self._records
+
+    def keys(self):
+        """Header keywords available in this instance."""
+        return list(self._records.dtype.names) + list(self._extra)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records.dtype.names or key in self._extra
 
-class Header(SimpleNamespace):
     def __getitem__(self, key):
-        return self.__dict__[key]
+        if key in self._records.dtype.names:
+            return self._records[key]
+        return self._extra[key]
 
     def __setitem__(self, key, value):
-        self.__dict__[key] = value
+        if key in self._records.dtype.names:
+            self._records[key] = value
+        else:
+            self._extra[key] = value
+
+    def __getattr__(self, key):
+        if key.startswith("_"):
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __dir__(self):
+        return list(super().__dir__()) + self.keys()
+
+    def __repr__(self):
+        return f"Header({len(self)} traces, keys={self.keys()})"
 
 
 class HeadersView:
-    def __init__(self, start, stop, headers):
+    def __init__(self, start, stop, headers, trace_order=None):
         self._start = start
         self._stop = stop
         self._headers = headers
+        self._trace_order = trace_order
 
     def __getitem__(self, header_keyword):
-        return self._headers[header_keyword][self._start : self._stop]
+        if self._trace_order is None:
+            return self._headers[header_keyword][self._start : self._stop]
+        trace_indices = self._trace_order[self._start : self._stop]
+        return self._headers[header_keyword][trace_indices]
+
+    @property
+    def records(self):
+        """Header records of these traces (a view for contiguous traces)."""
+        return self.records_range(0, self._stop - self._start)
+
+    def records_range(self, start, stop):
+        """Header records of traces ``start`` to ``stop`` of this view, e.g.
+        one block of a write. Only those traces are copied when the view is
+        not contiguous."""
+        start, stop = self._start + start, self._start + min(stop, self._stop - self._start)
+        if self._trace_order is None:
+            return self._headers.records[start:stop]
+        return self._headers.records[self._trace_order[start:stop]]
 
 
 class GatherView:
-    def __init__(self, start: int, stop: int, data, headers):
+    """Traces ``start`` to ``stop`` of a file.
+
+    When ``trace_order`` is given (gathers of a file that is not sorted by the
+    gather keyword), ``start`` and ``stop`` are positions in that permutation
+    and the traces are gathered from wherever they are in the file.
+
+    When ``cache`` (a GatherCache) is given, ``data`` is a read-only copy
+    served from it.
+    """
+
+    def __init__(self, start: int, stop: int, data, headers, trace_order=None, cache=None):
         self._start = start
         self._stop = stop
         self._origin_data = data
         self._origin_headers = headers
-        self._headers_view = HeadersView(start, stop, headers)
+        self._trace_order = trace_order
+        self._cache = cache
+        self._headers_view = HeadersView(start, stop, headers, trace_order)
         self.num_traces: int = stop - start
 
     @property
     def data(self):
-        return self._origin_data[:, self._start : self._stop]
+        if self._cache is not None:
+            return self._cache.get(self._start, self._stop)
+        if self._trace_order is None:
+            return self._origin_data[:, self._start : self._stop]
+        trace_indices = self._trace_order[self._start : self._stop]
+        return Utils.take_traces(self._origin_data, trace_indices)
 
     @property
     def headers(self):
         return self._headers_view
 
+    @property
+    def trace_major_data(self):
+        """Gather data as (num_traces, num_samples), i.e. ``data.T``.
+
+        Contiguous without copies when the file data is trace-major
+        (``order='F'`` or memory-mapped).
+        """
+        return self.data.T
+
 
 class iGatherIndexer:
 
-    def __init__(self, gather_indices: pd.DataFrame, origin_data, origin_headers):
-        self.gather_indices = gather_indices
+    def __init__(self, gather_index: GatherIndex, origin_data, origin_headers, trace_order=None):
+        self.gather_index = gather_index
         self.origin_data = origin_data
         self.origin_headers = origin_headers
+        self.trace_order = trace_order
+        self.cache = None
 
     def __getitem__(self, key):
-        if isinstance(key, int):
-            start_index = self.gather_indices["start"].iat[key]
-            stop_index = self.gather_indices["stop"].iat[key]
+        if isinstance(key, (int, np.integer)):
+            key = operator.index(key)
+            start_index = int(self.gather_index.start[key])
+            stop_index = int(self.gather_index.stop[key])
         elif isinstance(key, slice):
             if (not key.step is None) and (key.step != 1):
                 raise ValueError("No support for step in slice!")
             if key.start is None:
                 start_index = 0
             else:
-                start_index = self.gather_indices["start"].iat[key.start]
+                start_index = int(self.gather_index.start[key.start])
             if key.stop is None:
-                stop_index = self.origin_data.shape[1] - 1  # num_traces - 1
+                stop_index = int(self.gather_index.stop[-1]) if len(self.gather_index) else 0
             else:
-                stop_index = self.gather_indices["stop"].iat[key.stop - 1]
+                stop_index = int(self.gather_index.stop[key.stop - 1])
         else:
             raise TypeError("key must be either int or slice!")
-        return GatherView(start_index, stop_index, self.origin_data, self.origin_headers)
+        return GatherView(
+            start_index,
+            stop_index,
+            self.origin_data,
+            self.origin_headers,
+            self.trace_order,
+            self.cache,
+        )
 
 
 class vGatherIndexer:
 
-    def __init__(self, gather_indices: pd.DataFrame, origin_data, origin_headers):
-        self.gather_indices = gather_indices
+    def __init__(self, gather_index: GatherIndex, origin_data, origin_headers, trace_order=None):
+        self.gather_index = gather_index
         self.origin_data = origin_data
         self.origin_headers = origin_headers
+        self.trace_order = trace_order
+        self.cache = None
 
     def __getitem__(self, key):
-        print(f"key type {type(key)}")
-        if isinstance(key, int):
-            start_index = self.gather_indices["start"].at[key]
-            stop_index = self.gather_indices["stop"].at[key]
+        logger.debug("vGatherIndexer key type %s", type(key))
+        if isinstance(key, (int, np.integer)):
+            position = self.gather_index.position(key)
+            start_index = int(self.gather_index.start[position])
+            stop_index = int(self.gather_index.stop[position])
         elif isinstance(key, slice):
             if (not key.step is None) and (key.step != 1):
                 raise ValueError("No support for step in slice!")
             if key.start is None:
                 start_index = 0
             else:
-                start_index = self.gather_indices["start"].at[key.start]
+                start_index = int(self.gather_index.start[self.gather_index.position(key.start)])
             if key.stop is None:
-                stop_index = self.origin_data.shape[1] - 1  # num_traces - 1
+                stop_index = int(self.gather_index.stop[-1]) if len(self.gather_index) else 0
             else:
-                stop_index = self.gather_indices["stop"].at[key.stop]
+                stop_index = int(self.gather_index.stop[self.gather_index.position(key.stop)])
         else:
             raise TypeError("key must be either int or slice!")
-        return GatherView(start_index, stop_index, self.origin_data, self.origin_headers)
+        return GatherView(
+            start_index,
+            stop_index,
+            self.origin_data,
+            self.origin_headers,
+            self.trace_order,
+            self.cache,
+        )
 
 
 class SuFile:
@@ -105,23 +269,43 @@ class SuFile:
       num_traces (int): Number of traces.
       num_gathers (int): Number of gathers. None if gather_keyword was not
         specified at creation.
+      io_stats (IOStats): Timings and byte counts of the read that created
+        this instance, if ``stats`` was given. None otherwise.
     """
 
-    def __init__(self, data: npt.NDArray[np.float64], headers: Header, gather_keyword=None):
+    def __init__(
+        self,
+        data: npt.NDArray[np.float64],
+        headers: Header,
+        gather_keyword=None,
+        gather_index: GatherIndex = None,
+        sort: bool = False,
+        stats: IOStats = None,
+    ):
         """Initialize the instance using already prepared data.
 
         Args:
           data: Trace data for this instance.
           headers: Trace headers for this instance.
           gather_keyword: Header keyword that comprises the gathers.
+          gather_index: Precomputed gathers of ``gather_keyword`` (e.g. loaded
+            from a sidecar index). Computed from the headers if not given.
+          sort: Whether to group the traces by ``gather_keyword`` through a
+            stable sort permutation, for data that is not sorted by that
+            keyword. The data itself is not reordered.
+          stats: Optional IOStats in which to time building the gather index.
         """
         self.data = data
         self.headers = headers
         self.num_traces = data.shape[1]
         self.gather_keyword = gather_keyword
+        self.io_stats = stats if stats is not None and stats.enabled else None
 
         self.num_gathers = None
-        self.gather_indices_df = None
+        self.gather_index = None
+        self.gather_cache = None
+        self._header_query = None
+        self._gather_indices_df = None
         self._vGatherIndexer = None
         self._iGatherIndexer = None
 
@@ -132,26 +316,29 @@ class SuFile:
         # Set up gather slicing capabilites
         # ---------------------------------
 
-        separation_indices = [0]
-        separation_key = self.headers[gather_keyword]
+        stats = IOStats.get(stats)
+        if gather_index is None:
+            with stats.phase("gather_index"):
+                gather_index = GatherIndex.from_keys(self.headers[gather_keyword], sort)
+        self.gather_index = gather_index
+        self.num_gathers = len(gather_index)
 
-        gather_values = [separation_key[0]]
+        self._vGatherIndexer = vGatherIndexer(gather_index, data, headers, gather_index.order)
+        self._iGatherIndexer = iGatherIndexer(gather_index, data, headers, gather_index.order)
 
-        for trace_index in range(1, self.num_traces):
-            if separation_key[trace_index] != separation_key[trace_index - 1]:
-                gather_values.append(separation_key[trace_index])
-                separation_indices.append(trace_index)
-        separation_indices.append(self.num_traces)
+    def reindex(self, gather_keyword: str, sort: bool = False, gather_index: GatherIndex = None):
+        """Access the same traces through the gathers of another keyword.
 
-        self.gather_indices_df = pd.DataFrame(
-            {"start": separation_indices[:-1], "stop": separation_indices[1:]},
-            index=gather_values,
-        )
-
-        self.num_gathers = len(separation_indices) - 1
+        The returned instance shares data and headers with this one, so a file
+        can be indexed by several keywords at once without copies.
 
-        self._vGatherIndexer = vGatherIndexer(self.gather_indices_df, data, headers)
-        self._iGatherIndexer = iGatherIndexer(self.gather_indices_df, data, headers)
+        Args:
+          gather_keyword: Header keyword that comprises the gathers.
+          sort: Whether to group the traces through a sort permutation, for
+            data that is not sorted by ``gather_keyword``.
+          gather_index: Precomputed gathers of ``gather_keyword``.
+        """
+        return SuFile(self.data, self.headers, gather_keyword, gather_index, sort)
 
     @staticmethod
     def new_empty_gathers(
@@ -159,22 +346,122 @@ class SuFile:
         gather_keyword: str,
         gather_values: list,
         num_traces_per_gather: int,
+        order: str = "C",
     ):
         num_traces = num_traces_per_gather * len(gather_values)
-        traces = np.zeros(shape=(num_samples_per_trace, num_traces), dtype=float)
-        headers = Utils.new_empty_header(num_traces)
+        traces = np.zeros(shape=(num_samples_per_trace, num_traces), dtype=float, order=order)
+        headers = Header(np.zeros(num_traces, dtype=HEADER_DTYPE))
         for i, value in enumerate(gather_values):
             itrace_start = i * num_traces_per_gather
             itrace_end = itrace_start + num_traces_per_gather
             headers[gather_keyword][itrace_start:itrace_end] = value
 
-        return SuFile(traces, Header(**headers), gather_keyword)
+        return SuFile(traces, headers, gather_keyword)
+
+    def select(self, **conditions) -> GatherView:
+        """Select the traces whose headers meet all the given conditions.
+
+        Conditions are given per header keyword, e.g.
+        ``select(cdp=(2000, 2100), offset=(500, 1500))``:
+        - A single value: traces with that value.
+        - A ``(low, high)`` tuple: traces with a value in that range, both
+          ends included. Either end may be None.
+        - A list, set or array of values: traces with any of those values.
+        - A function of the header column returning a boolean mask.
+
+        Single values and ranges use a sorted index of the keyword (built on
+        first use and kept), so they are answered by binary search. Header
+        edits made after an index was built are not seen by it.
+
+        Returns:
+          A view of the selected traces, in file order, with ``data``,
+          ``headers`` and ``num_traces`` like a gather. Nothing is copied
+          until its data or headers are accessed. To save the selection, use
+          ``writesu(file_path, view.data, view.headers)``.
+        """
+        if self._header_query is None:
+            self._header_query = HeaderQuery(self.headers)
+        trace_indices = self._header_query.select(**conditions)
+        return GatherView(0, len(trace_indices), self.data, self.headers, trace_indices)
+
+    def enable_cache(self, max_bytes: int, readahead: int = 1) -> GatherCache:
+        """Cache the data of gathers accessed through ``gather``/``igather``.
+
+        Useful for disk-backed (memory-mapped) files whose gathers are
+        accessed repeatedly in random order. Gathers are evicted in least
+        recently used order to stay within ``max_bytes``; the hit, miss and
+        eviction counters are in ``gather_cache.stats()``. Cached gather data
+        is read-only.
+
+        Args:
+          max_bytes: Byte budget of the cached gather data.
+          readahead: Number of adjacent gathers loaded in the background on
+            each side of a gather that was not cached.
+
+        Returns:
+          The GatherCache, also available as ``gather_cache``.
+        """
+        if self.gather_keyword is None:
+            raise ValueError("Gather caching needs an SuFile with a gather_keyword")
+        if self.gather_cache is not None:
+            self.gather_cache.close()
+        self.gather_cache = GatherCache(self.data, self.gather_index, max_bytes, readahead)
+        self._vGatherIndexer.cache = self.gather_cache
+        self._iGatherIndexer.cache = self.gather_cache
+        return self.gather_cache
+
+    def disable_cache(self):
+        """Stop caching gather data, drop the cached gathers and stop the
+        readahead thread of the cache."""
+        if self.gather_cache is not None:
+            self.gather_cache.close()
+        self.gather_cache = None
+        if self.gather_keyword is not None:
+            self._vGatherIndexer.cache = None
+            self._iGatherIndexer.cache = None
+
+    def map_gathers(self, func, workers: int = 1, out: "SuFile" = None) -> "SuFile":
+        """Apply a function to every gather, in parallel worker processes.
+
+        ``func`` receives a GatherView and returns the processed gather data
+        (num_samples, num_traces of the gather), which is stored for the same
+        traces in ``out.data``. Returning None leaves ``out`` untouched.
+
+        Data, header columns and output data are shared with the workers
+        instead of being sent to them: memory-mapped files are opened again
+        by each worker, other arrays are placed in shared memory. Only gather
+        ranges are sent, so ``func`` must be picklable (e.g. a module level
+        function).
+
+        Args:
+          func: Function applied to each gather.
+          workers: Number of worker processes. With 1, gathers are processed
+            in this process.
+          out: SuFile receiving the results, with the same traces as this
+            one (e.g. a file opened with ``mmap=True, writable=True``). A new
+            in-memory SuFile with a copy of the headers if not given.
+
+        Returns:
+          The output SuFile.
+        """
+        from .GatherMapModel import GatherMap
+
+        return GatherMap.run(self, func, workers, out)
 
     @property
     def num_samples(self) -> int:
         """Number of samples per data trace."""
         return self.headers.ns[0]
 
+    @property
+    def trace_major_data(self):
+        """Trace data as (num_traces, num_samples), i.e. ``data.T``.
+
+        Contiguous without copies when the data is trace-major (read with
+        ``order='F'`` or memory-mapped).
+        """
+        return self.data.T
+
     @property
     def gather(self) -> vGatherIndexer:
         """Access a single gather or a group of gathers by label.
@@ -193,7 +480,9 @@ class SuFile:
         In order to work correctly, this feature needs two conditions met:
         - The ``gather_keyword`` attribute was set to a valid keyword when
           creating the object.
-        - The traces in the file are already sorted by the specified keyword.
+        - The traces in the file are already sorted by the specified keyword,
+          or the object was created with ``sort=True``. In the latter case,
+          gathers are copied from their traces wherever they are in the file.
         """
         return self._vGatherIndexer
 
@@ -212,22 +501,38 @@ class SuFile:
         In order to work correctly, this feature needs two conditions met:
         - The ``gather_keyword`` attribute was set to a valid keyword when
           creating the object.
-        - The traces in the file are already sorted by the specified keyword.
+        - The traces in the file are already sorted by the specified keyword,
+          or the object was created with ``sort=True``. In the latter case,
+          gathers are copied from their traces wherever they are in the file.
         """
         return self._iGatherIndexer
 
     @property
     def gather_values(self):
-        return self.gather_indices_df.index.to_numpy()
+        return self.gather_index.values
+
+    @property
+    def gather_indices_df(self):
+        """The start and stop of each gather as a pandas DataFrame indexed by
+        gather value. pandas is only imported (and the DataFrame built) on
+        first access. None if gather_keyword was not specified at creation.
+        """
+        if self.gather_index is None:
+            return None
+        if self._gather_indices_df is None:
+            import pandas as pd
+
+            with IOStats.get(self.io_stats).phase("gather_indices_df"):
+                self._gather_indices_df = pd.DataFrame(
+                    {"start": self.gather_index.start, "stop": self.gather_index.stop},
+                    index=self.gather_index.values,
+                )
+        return self._gather_indices_df
 
     def gather_value_to_index(self, gather_value: int):
         """Find out the integer position index of the gather with the given value"""
-        gather_values: pd.Index = self.gather_indices_df.index
-        gather_index = gather_values.get_loc(gather_value)
-        return gather_index
+        return self.gather_index.position(gather_value)
 
     def gather_index_to_value(self, gather_index: int):
         """Find out the value of the gather with the given integer position index"""
-        gather_values: pd.Index = self.gather_indices_df.index
-        gather_value = gather_values[gather_index]
-        return gather_value
+        return self.gather_index.values[gather_index]
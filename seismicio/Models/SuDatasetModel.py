@@ -0,0 +1,326 @@
+import glob
+import operator
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .UtilsModel import Utils
+from .GatherIndexModel import GatherIndex
+from .InOutSuModel import InOutSu
+from .SuzModel import Suz
+from .SuDataModel import GatherView, Header
+
+
+class SuDatasetFile:
+    """Reads traces of one file of an SuDataset, as SU trace records.
+
+    SU files are read with positional reads (several threads can read the
+    same file at once); compressed SU containers through their lazy trace
+    data, so only the chunks holding the traces are decompressed.
+    """
+
+    def __init__(self, file_path):
+        self._file = open(file_path, "rb")
+        self._lock = threading.Lock()
+        self._sufile = None
+        if Suz.is_suz(self._file):
+            self._sufile = Suz.unpack_suz(self._file, lazy=True)
+            self.trace_dtype = Utils.trace_dtype(self._sufile.data.shape[0])
+        else:
+            self.trace_dtype, _ = InOutSu.read_layout(self._file)
+
+    def read_records(self, trace_indices):
+        """Trace records of the given (increasing) trace indices."""
+        records = np.empty(len(trace_indices), dtype=self.trace_dtype)
+        if self._sufile is not None:
+            records["header"] = self._sufile.headers.records[trace_indices]
+            records["data"] = self._sufile.data.take_traces(trace_indices)
+            return records
+
+        # One read per run of consecutive traces
+        for run_start, run_stop in zip(*Utils.trace_runs(trace_indices)):
+            offset = int(trace_indices[run_start]) * self.trace_dtype.itemsize
+            self._read_at(records[run_start:run_stop], offset)
+        return records
+
+    def _read_at(self, records, offset):
+        if hasattr(os, "pread"):
+            Utils.pread_into(self._file.fileno(), records, offset)
+        else:
+            with self._lock:
+                self._file.seek(offset)
+                Utils.read_into(self._file, records)
+
+    def close(self):
+        self._file.close()
+
+
+class SuDatasetGatherIndexer:
+    """``gather``/``igather`` of an SuDataset: gathers by value or by
+    position, read from the files that hold their traces."""
+
+    def __init__(self, dataset, by_value):
+        self.dataset = dataset
+        self.by_value = by_value
+
+    def _position(self, key):
+        if self.by_value:
+            return self.dataset.gather_value_to_index(key)
+        try:
+            return range(self.dataset.num_gathers)[operator.index(key)]
+        except TypeError:
+            raise TypeError("key must be either int or slice!") from None
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if (not key.step is None) and (key.step != 1):
+                raise ValueError("No support for step in slice!")
+            if not self.by_value:
+                first, last, _ = key.indices(self.dataset.num_gathers)
+            else:
+                # Label slices include their stop, as in SuFile.gather
+                first = 0 if key.start is None else self._position(key.start)
+                last = self.dataset.num_gathers if key.stop is None else self._position(key.stop) + 1
+            return self.dataset.read_gather_range(first, max(first, last))
+        first = self._position(key)
+        return self.dataset.read_gather_range(first, first + 1)
+
+
+class SuDataset:
+    """Gathers of a survey stored as many SU files (e.g. one per shot line
+    or swath), accessed as if they were a single file.
+
+    Opening a dataset only reads the ``gather_keyword`` header of each file
+    (or its sidecar gather index) to build a global gather index; traces are
+    read when gathers are accessed. Traces with the same gather value in
+    several files (or in separate runs of one file) make up one gather, in
+    file order. Both SU files and compressed SU containers can be part of a
+    dataset.
+
+    Gathers are read into memory as GatherViews, like the gathers of an
+    SuFile. Use ``read_gathers`` to read several gathers at once with
+    worker threads.
+
+    Attributes:
+      files (list): Paths of the files of the dataset.
+      gather_keyword (str): Header keyword that comprises the gathers.
+      file_gather_indices (list): GatherIndex of each file.
+      gather_values (ndarray): Value of each gather. In order of first
+        appearance in the files, or sorted if created with ``sort=True``.
+      num_gathers (int): Number of gathers.
+      num_traces (int): Number of traces of all files.
+    """
+
+    EXTENSIONS = (".su", ".suz")
+
+    def __init__(self, paths, gather_keyword, sort=False, sidecar=True, workers=1, order="C"):
+        """Open the files and build the global gather index.
+
+        Args:
+          paths: A directory (all its ``.su`` and ``.suz`` files), a glob
+            pattern, or a list of file paths.
+          gather_keyword: Header keyword that comprises the gathers.
+          sort: Whether the files may not be sorted by ``gather_keyword``
+            (each file is indexed through a sort permutation), and gathers
+            are ordered by value.
+          sidecar: Whether to cache the gather index of each file in its
+            sidecar index file (see ``indexsu``), so the headers of a file
+            are only scanned again when the file changes.
+          workers: Number of threads scanning the files, and the default
+            number of threads of ``read_gathers``.
+          order: Memory layout of the data of the gathers read, as in
+            ``readsu``.
+        """
+        self.files = SuDataset.find_files(paths)
+        self.gather_keyword = gather_keyword
+        self.sort = sort
+        self.sidecar = sidecar
+        self.workers = workers
+        self.order = order
+        self._readers = [None] * len(self.files)
+        self._lock = threading.Lock()
+
+        with ThreadPoolExecutor(max(1, workers)) as executor:
+            self.file_gather_indices = list(executor.map(self._index_file, self.files))
+        self._build_gather_index()
+
+        self._vGatherIndexer = SuDatasetGatherIndexer(self, by_value=True)
+        self._iGatherIndexer = SuDatasetGatherIndexer(self, by_value=False)
+
+    @staticmethod
+    def find_files(paths):
+        """Sorted file paths of a directory or glob pattern, or the given
+        list of paths."""
+        if isinstance(paths, (str, os.PathLike)):
+            paths = os.fspath(paths)
+            if os.path.isdir(paths):
+                files = sorted(
+                    os.path.join(paths, name)
+                    for name in os.listdir(paths)
+                    if name.endswith(SuDataset.EXTENSIONS)
+                )
+            else:
+                # Sidecar index files may match the pattern too
+                files = sorted(
+                    path
+                    for path in glob.glob(paths)
+                    if os.path.isfile(path) and not path.endswith(GatherIndex.sidecar_path(""))
+                )
+        else:
+            files = [os.fspath(path) for path in paths]
+        if not files:
+            raise FileNotFoundError(f"No SU files found in {paths!r}")
+        return files
+
+    @staticmethod
+    def read_keys(file_path, gather_keyword):
+        # Values of one header keyword of every trace of a file
+        with open(file_path, "rb") as file:
+            if Suz.is_suz(file):
+                return Suz.unpack_suz_headers(file, [gather_keyword])[gather_keyword]
+        return InOutSu.map_su_headers(file_path, [gather_keyword])[gather_keyword]
+
+    def _index_file(self, file_path):
+        gather_index = None
+        if self.sidecar:
+            gather_index = GatherIndex.load(file_path, self.gather_keyword, self.sort)
+        if gather_index is None:
+            keys = SuDataset.read_keys(file_path, self.gather_keyword)
+            gather_index = GatherIndex.from_keys(keys, self.sort)
+            if self.sidecar:
+                GatherIndex.try_save(file_path, {self.gather_keyword: gather_index})
+        return gather_index
+
+    def _build_gather_index(self):
+        # Each gather of each file is a piece; the pieces with the same value
+        # make up a gather of the dataset. Pieces are grouped by gather, in
+        # file order within each gather
+        indices = self.file_gather_indices
+        piece_file = np.concatenate(
+            [np.full(len(gather_index), file, dtype=np.intp) for file, gather_index in enumerate(indices)]
+        )
+        piece_start = np.concatenate([gather_index.start for gather_index in indices]).astype(np.intp)
+        piece_stop = np.concatenate([gather_index.stop for gather_index in indices]).astype(np.intp)
+        piece_values = np.concatenate([gather_index.values for gather_index in indices])
+
+        values, first_piece, piece_gather = np.unique(piece_values, return_index=True, return_inverse=True)
+        if not self.sort:
+            # Gathers in order of first appearance
+            appearance = np.argsort(first_piece, kind="stable")
+            rank = np.empty(len(values), dtype=np.intp)
+            rank[appearance] = np.arange(len(values))
+            values = values[appearance]
+            piece_gather = rank[piece_gather.reshape(-1)]
+
+        pieces = np.argsort(piece_gather, kind="stable")
+        self._piece_file = piece_file[pieces]
+        self._piece_start = piece_start[pieces]
+        self._piece_stop = piece_stop[pieces]
+        gather_first_piece = np.concatenate(
+            ([0], np.cumsum(np.bincount(piece_gather.reshape(-1), minlength=len(values))))
+        )
+        # Pieces of each gather (start and stop are positions in the pieces)
+        self._gather_pieces = GatherIndex(gather_first_piece[:-1], gather_first_piece[1:], values)
+        self.gather_values = values
+        self.num_gathers = len(values)
+        self.num_traces = int(np.sum(piece_stop - piece_start))
+
+    def _reader(self, file):
+        # Files are opened on first access
+        reader = self._readers[file]
+        if reader is None:
+            with self._lock:
+                if self._readers[file] is None:
+                    self._readers[file] = SuDatasetFile(self.files[file])
+                reader = self._readers[file]
+        return reader
+
+    def read_gather_range(self, first: int, last: int) -> GatherView:
+        """Read the traces of gathers ``first`` to ``last`` (positions, last
+        excluded) into one GatherView."""
+        parts = []
+        first_piece = int(self._gather_pieces.start[first]) if first < self.num_gathers else 0
+        last_piece = int(self._gather_pieces.stop[last - 1]) if last > first else first_piece
+        for piece in range(first_piece, last_piece):
+            file = int(self._piece_file[piece])
+            gather_index = self.file_gather_indices[file]
+            start, stop = int(self._piece_start[piece]), int(self._piece_stop[piece])
+            if gather_index.order is None:
+                trace_indices = np.arange(start, stop)
+            else:
+                trace_indices = gather_index.order[start:stop]
+            parts.append(self._reader(file).read_records(trace_indices))
+
+        if not parts:
+            return GatherView(0, 0, np.zeros((0, 0), dtype=np.float32), Header())
+        num_samples = parts[0].dtype["data"].shape[0]
+        if any(part.dtype["data"].shape[0] != num_samples for part in parts):
+            raise ValueError("Gathers spanning several files need the same number of samples in every file")
+        if any(part.dtype != parts[0].dtype for part in parts):
+            # Files of different byte orders
+            parts = [part.astype(Utils.trace_dtype(num_samples), copy=False) for part in parts]
+        records = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return InOutSu.records_to_gather(records, self.order)
+
+    def read_gathers(self, gather_values, workers: int = None) -> list:
+        """Read several gathers by value, in parallel threads.
+
+        Args:
+          gather_values: Values of the gathers to read.
+          workers: Number of threads. The ``workers`` of the dataset if not
+            given.
+
+        Returns:
+          The GatherViews, in the order of ``gather_values``.
+        """
+        positions = [self.gather_value_to_index(value) for value in gather_values]
+        workers = self.workers if workers is None else workers
+        if workers <= 1:
+            return [self.read_gather_range(position, position + 1) for position in positions]
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(lambda position: self.read_gather_range(position, position + 1), positions))
+
+    @property
+    def gather(self) -> SuDatasetGatherIndexer:
+        """Read a single gather or a group of gathers by label, as
+        ``SuFile.gather`` (label slices include their stop)."""
+        return self._vGatherIndexer
+
+    @property
+    def igather(self) -> SuDatasetGatherIndexer:
+        """Read a single gather or an interval of gathers by zero-based
+        integer position, as ``SuFile.igather``."""
+        return self._iGatherIndexer
+
+    def gather_value_to_index(self, gather_value):
+        """Find out the integer position index of the gather with the given value"""
+        return self._gather_pieces.position(gather_value)
+
+    def gather_index_to_value(self, gather_index: int):
+        """Find out the value of the gather with the given integer position index"""
+        return self.gather_values[gather_index]
+
+    def close(self):
+        """Close the files opened to read gathers."""
+        with self._lock:
+            for reader in self._readers:
+                if reader is not None:
+                    reader.close()
+            self._readers = [None] * len(self.files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.num_gathers
+
+    def __repr__(self):
+        return (
+            f"SuDataset({len(self.files)} files, {self.num_traces} traces, "
+            f"{self.num_gathers} gathers of {self.gather_keyword!r})"
+        )
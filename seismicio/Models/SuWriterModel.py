@@ -0,0 +1,144 @@
+import os
+import numpy as np
+
+from .UtilsModel import Utils
+from .InOutSuModel import InOutSu
+from .SuDataModel import GatherView
+from .IOStatsModel import IOStats
+
+
+class SuWriter:
+    """Write a seismic data file in SU format incrementally.
+
+    Traces are packed into a buffer of trace records and written in large
+    sequential writes, so a processing flow can write its output gather by
+    gather without keeping the whole volume in memory.
+
+    Use it as a context manager, so the buffered traces are written when the
+    block ends::
+
+        with SuWriter(file_path) as writer:
+            for gather in iter_gathers(input_path, "fldr"):
+                writer.write_gather(gather)
+
+    Attributes:
+      num_samples (int): Number of samples per trace. None until the first
+        traces are written.
+      num_traces (int): Number of traces written so far, including the ones
+        still buffered.
+    """
+
+    def __init__(self, file_path, mem_fs=None, chunk_traces=None, fsync=False, stats=None, byteorder="<"):
+        """Open the file for writing, replacing any existing content.
+
+        Args:
+          file_path: Path of the file to write.
+          mem_fs: Optional in-memory file system to write to, as in
+            ``writesuInMemory``.
+          chunk_traces: Number of traces buffered per write. Sized to a large
+            write if not given.
+          fsync: Whether ``checkpoint`` also asks the OS to commit the file
+            to disk.
+          stats: Optional IOStats in which to time packing and writing.
+          byteorder: Byte order of the file: ``'<'`` or ``'little'``
+            (default), ``'>'`` or ``'big'``.
+        """
+        self._byteorder = Utils.check_byteorder(byteorder)
+        opener = open if mem_fs is None else mem_fs.open
+        self._file = opener(file_path, "wb")
+        self._chunk_traces = chunk_traces
+        self._fsync = fsync
+        self._stats = IOStats.get(stats)
+        self._buffer = None
+        self._buffered = 0
+        self.num_samples = None
+        self.num_traces = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_traces(self, traces_data, hdr):
+        """Append traces to the file.
+
+        Args:
+          traces_data: Trace data as (num_samples, num_traces).
+          hdr: Headers of these traces: a Header, a dict from
+            ``Utils.new_empty_header`` or a gather's ``headers``.
+        """
+        n_samples, n_traces = traces_data.shape
+        if self._buffer is None:
+            self._start(n_samples)
+        elif n_samples != self.num_samples:
+            raise ValueError(
+                f"Expected traces with {self.num_samples} samples, got {n_samples}"
+            )
+
+        start = 0
+        while start < n_traces:
+            count = min(len(self._buffer) - self._buffered, n_traces - start)
+            records = self._buffer[self._buffered : self._buffered + count]
+            InOutSu.pack_records(records, traces_data, hdr, start, self._stats)
+            self._buffered += count
+            self.num_traces += count
+            start += count
+            if self._buffered == len(self._buffer):
+                self.flush()
+
+    def write_gather(self, data, headers=None):
+        """Append a gather to the file.
+
+        Args:
+          data: A GatherView (e.g. from ``SuFile.igather`` or
+            ``iter_gathers``), or the gather trace data as
+            (num_samples, num_traces).
+          headers: Headers of the gather, if ``data`` is not a GatherView.
+        """
+        if isinstance(data, GatherView):
+            data, headers = data.data, data.headers
+        self.write_traces(data, headers)
+
+    def flush(self):
+        """Write the buffered traces to the file."""
+        if self._buffered:
+            with self._stats.phase("write"):
+                self._file.write(memoryview(self._buffer[: self._buffered]).cast("B"))
+            self._stats.add_written(self._buffer.itemsize * self._buffered, self._buffered)
+            self._buffered = 0
+
+    def checkpoint(self, fsync=None):
+        """Write the buffered traces and flush the file.
+
+        Args:
+          fsync: Whether to also ask the OS to commit the file to disk.
+            Defaults to the ``fsync`` given at creation. Ignored for files
+            without a file descriptor (in-memory file systems).
+        """
+        self.flush()
+        self._file.flush()
+        if self._fsync if fsync is None else fsync:
+            try:
+                file_descriptor = self._file.fileno()
+            except (AttributeError, OSError):
+                return
+            os.fsync(file_descriptor)
+
+    def close(self):
+        """Write the buffered traces and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self.checkpoint()
+        finally:
+            self._file.close()
+
+    def _start(self, n_samples):
+        trace_dtype = Utils.trace_dtype(n_samples, self._byteorder)
+        chunk_traces = self._chunk_traces or Utils.get_chunk_traces(trace_dtype.itemsize)
+        # Zeroed once, so the unassigned header bytes stay zero in every
+        # write from header columns
+        self._buffer = np.zeros(chunk_traces, dtype=trace_dtype)
+        self.num_samples = n_samples
+
@@ -0,0 +1,233 @@
+import io
+import lzma
+import struct
+import zlib
+import numpy as np
+
+from .UtilsModel import Utils
+from .GatherIndexModel import GatherIndex
+from .SuDataModel import SuFile, Header, GatherView
+from .CompressedTracesModel import CompressedTraces
+from .IOStatsModel import IOStats
+from ..constants.HEADER_DTYPE import HEADER_DTYPE
+from ..constants.HEADER_KEYS import HEADER_KEYS
+from ..constants.SUZ_MAGIC import SUZ_MAGIC
+
+# Offset and length of the index, at the very end of the container
+FOOTER_FORMAT = '<QQ'
+
+
+class Suz:
+    """Compressed SU container.
+
+    A container stores the same traces and 240-byte headers as an SU file,
+    compressed with a standard library codec (zlib or lzma):
+
+    - The samples are split in chunks of whole traces (one chunk per gather,
+      or per ``chunk_traces`` traces), each compressed on its own, so any
+      gather can be read by decompressing only the chunks that hold it.
+    - Headers are stored by column (one compressed block per header field),
+      where repeated and slowly varying values compress well.
+    - Before compression, the bytes of each value are regrouped by position
+      (all first bytes, then all second bytes, ...), which makes float
+      samples much more compressible.
+
+    Layout: ``SUZ_MAGIC``, the sample chunks, the header columns, the index
+    (an .npz archive with the position and size of every block) and the
+    footer (offset and length of the index).
+    """
+
+    CODECS = {
+        'zlib': (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+        'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    }
+
+    # Default size of the sample chunks, in uncompressed bytes
+    CHUNK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def is_suz(file):
+        """Whether an open file is a compressed SU container."""
+        file.seek(0)
+        return file.read(len(SUZ_MAGIC)) == SUZ_MAGIC
+
+    @staticmethod
+    def shuffle(array):
+        # Bytes of an array, grouped by byte position within each value
+        itemsize = array.dtype.itemsize
+        return np.ascontiguousarray(array).view(np.uint8).reshape(-1, itemsize).T.tobytes()
+
+    @staticmethod
+    def unshuffle(data, dtype):
+        dtype = np.dtype(dtype)
+        planes = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, -1)
+        return np.ascontiguousarray(planes.T).view(dtype).reshape(-1)
+
+    @staticmethod
+    def chunk_bounds(hdr, num_samples, num_traces, gather_keyword=None, chunk_traces=None):
+        # First trace of each chunk, followed by the number of traces. With a
+        # gather_keyword, chunks are the gathers of the (sorted) traces
+        if gather_keyword is not None:
+            gather_index = GatherIndex.from_keys(hdr[gather_keyword])
+            return np.concatenate((gather_index.start, [num_traces])).astype(np.int64)
+        if chunk_traces is None:
+            chunk_traces = max(1, Suz.CHUNK_SIZE // (4 * max(num_samples, 1)))
+        return np.append(np.arange(0, num_traces, chunk_traces), num_traces).astype(np.int64)
+
+    @staticmethod
+    def header_records(hdr, num_traces):
+        # hdr as (little-endian) HEADER_DTYPE records
+        records = getattr(hdr, 'records', None)
+        if records is not None and Utils.is_header_dtype(records.dtype):
+            return records.astype(HEADER_DTYPE, copy=False)
+        records = np.zeros(num_traces, dtype=HEADER_DTYPE)
+        for key in HEADER_KEYS:
+            try:
+                records[key] = hdr[key]
+            except KeyError:
+                pass
+        return records
+
+    @staticmethod
+    def pack_and_save_suz(
+        file, traces_data, hdr, gather_keyword=None, codec='zlib', level=None, chunk_traces=None, stats=None
+    ):
+        stats = IOStats.get(stats)
+        if codec not in Suz.CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {sorted(Suz.CODECS)}")
+        compress, _ = Suz.CODECS[codec]
+        num_samples, num_traces = traces_data.shape
+        chunk_start = Suz.chunk_bounds(hdr, num_samples, num_traces, gather_keyword, chunk_traces)
+
+        file.write(SUZ_MAGIC)
+        offset = len(SUZ_MAGIC)
+
+        def write_block(array):
+            nonlocal offset
+            with stats.phase('compress'):
+                compressed = compress(Suz.shuffle(array), level)
+            with stats.phase('write'):
+                file.write(compressed)
+            stats.add_written(len(compressed))
+            offset += len(compressed)
+            return offset - len(compressed), len(compressed)
+
+        # Samples, trace by trace, one compressed block per chunk
+        chunk_blocks = [
+            write_block(np.asarray(traces_data[:, start:stop].T, dtype='<f4'))
+            for start, stop in zip(chunk_start[:-1].tolist(), chunk_start[1:].tolist())
+        ]
+
+        # Headers, one compressed block per field
+        records = Suz.header_records(hdr, num_traces)
+        header_names = list(HEADER_DTYPE.names)
+        header_blocks = [write_block(records[name]) for name in header_names]
+
+        index = io.BytesIO()
+        np.savez(
+            index,
+            num_samples=num_samples,
+            codec=codec,
+            chunk_start=chunk_start,
+            chunk_offset=np.array([block[0] for block in chunk_blocks], dtype=np.int64),
+            chunk_length=np.array([block[1] for block in chunk_blocks], dtype=np.int64),
+            header_names=np.array(header_names),
+            header_offset=np.array([block[0] for block in header_blocks], dtype=np.int64),
+            header_length=np.array([block[1] for block in header_blocks], dtype=np.int64),
+        )
+        file.write(index.getbuffer())
+        file.write(struct.pack(FOOTER_FORMAT, offset, index.tell()))
+        stats.add_written(0, num_traces)
+
+    @staticmethod
+    def read_index(file):
+        # The index arrays of an open container
+        file.seek(-struct.calcsize(FOOTER_FORMAT), io.SEEK_END)
+        index_offset, index_length = struct.unpack(FOOTER_FORMAT, file.read(struct.calcsize(FOOTER_FORMAT)))
+        file.seek(index_offset)
+        with np.load(io.BytesIO(file.read(index_length)), allow_pickle=False) as index:
+            return dict(index)
+
+    @staticmethod
+    def decompressor(index):
+        # Function decompressing a block into an array of the given dtype
+        _, decompress = Suz.CODECS[str(index['codec'])]
+        return lambda data, dtype: Suz.unshuffle(decompress(data), dtype)
+
+    @staticmethod
+    def unpack_suz_headers(file, keys=None, index=None, stats=None):
+        # Header records of a container. Only the columns of the given keys
+        # are decompressed (all of them if None)
+        stats = IOStats.get(stats)
+        if index is None:
+            index = Suz.read_index(file)
+        decompress = Suz.decompressor(index)
+        num_traces = int(index['chunk_start'][-1])
+        if keys is None:
+            header_records = np.zeros(num_traces, dtype=HEADER_DTYPE)
+        else:
+            header_records = np.zeros(num_traces, dtype=[(key, HEADER_DTYPE[key]) for key in keys])
+
+        names = header_records.dtype.names
+        for name, offset, length in zip(index['header_names'].tolist(), index['header_offset'], index['header_length']):
+            if name not in names:
+                continue
+            with stats.phase('read'):
+                file.seek(int(offset))
+                compressed = file.read(int(length))
+            stats.add_read(len(compressed))
+            with stats.phase('decompress'):
+                column = decompress(compressed, header_records.dtype[name].base)
+            with stats.phase('headers'):
+                header_records[name] = column.reshape(header_records[name].shape)
+        return header_records
+
+    @staticmethod
+    def unpack_suz(file, gather_keyword=None, sort=False, order='C', lazy=False, stats=None, gather_index=None):
+        # Read a container into an SuFile. With lazy=True, the trace data is
+        # a CompressedTraces that decompresses chunks on access (and keeps
+        # the file open); otherwise all chunks are decompressed at once
+        stats = IOStats.get(stats)
+        index = Suz.read_index(file)
+        num_samples = int(index['num_samples'])
+        traces = CompressedTraces(
+            file,
+            num_samples,
+            index['chunk_start'],
+            index['chunk_offset'],
+            index['chunk_length'],
+            Suz.decompressor(index),
+        )
+        header_records = Suz.unpack_suz_headers(file, index=index, stats=stats)
+        if lazy:
+            traces_data = traces
+        else:
+            traces_data = np.empty(traces.shape, dtype=np.float32, order=order)
+            chunk_start = index['chunk_start'].tolist()
+            for chunk, (start, stop) in enumerate(zip(chunk_start[:-1], chunk_start[1:])):
+                with stats.phase('decompress'):
+                    chunk_traces = traces.read_chunk(chunk)
+                with stats.phase('samples'):
+                    traces_data[:, start:stop] = chunk_traces.T
+            stats.add_read(traces.compressed_nbytes, traces.shape[1])
+        return SuFile(traces_data, Header(header_records), gather_keyword, gather_index, sort, stats)
+
+    @staticmethod
+    def iter_unpack_suz(file, gather_keyword=None, chunk_traces=None, order='C'):
+        # Stream a container gather by gather, as InOutSu.iter_unpack_su
+        # does for .su files: a new gather starts wherever the keyword value
+        # changes, and without a keyword blocks of chunk_traces traces are
+        # yielded. Only the chunks holding each gather are decompressed
+        sufile = Suz.unpack_suz(file, gather_keyword, lazy=True)
+        num_samples, num_traces = sufile.data.shape
+        if gather_keyword is not None:
+            bounds = np.append(sufile.gather_index.start, num_traces)
+        else:
+            if chunk_traces is None:
+                chunk_traces = Utils.get_chunk_traces(Utils.trace_dtype(num_samples).itemsize)
+            bounds = np.append(np.arange(0, num_traces, chunk_traces), num_traces)
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            traces_data = np.empty((num_samples, stop - start), dtype=np.float32, order=order)
+            traces_data[...] = sufile.data.read_traces(start, stop).T
+            header_records = sufile.headers.records[start:stop].copy()
+            yield GatherView(0, stop - start, traces_data, Header(header_records))
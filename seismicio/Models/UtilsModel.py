@@ -1,6 +1,9 @@
+import os
 import numpy as np
 from io import SEEK_END
 from ..constants.TRACE_HEADER_SIZE import TRACE_HEADER_SIZE
+from ..constants.HEADER_DTYPE import HEADER_DTYPE
+from ..constants.IO_CHUNK_SIZE import IO_CHUNK_SIZE
 
 class Utils():
 	@staticmethod
@@ -17,88 +20,107 @@ class Utils():
 		return file.tell()
 
 	@staticmethod
-	def new_empty_header(traces_amount):
-		header = {
-			'tracl': np.zeros(traces_amount, dtype=np.int32),
-			'tracr': np.zeros(traces_amount, dtype=np.int32),
-			'fldr': np.zeros(traces_amount, dtype=np.int32),
-			'tracf': np.zeros(traces_amount, dtype=np.int32),
-			'ep': np.zeros(traces_amount, dtype=np.int32),
-			'cdp': np.zeros(traces_amount, dtype=np.int32),
-			'cdpt': np.zeros(traces_amount, dtype=np.int32),
-			'trid': np.zeros(traces_amount, dtype=np.int16),
-			'nvs': np.zeros(traces_amount, dtype=np.int16),
-			'nhs': np.zeros(traces_amount, dtype=np.int16),
-			'duse': np.zeros(traces_amount, dtype=np.int16),
-			'offset': np.zeros(traces_amount, dtype=np.int32),
-			'gelev': np.zeros(traces_amount, dtype=np.int32),
-			'selev': np.zeros(traces_amount, dtype=np.int32),
-			'sdepth': np.zeros(traces_amount, dtype=np.int32),
-			'gdel': np.zeros(traces_amount, dtype=np.int32),
-			'sdel': np.zeros(traces_amount, dtype=np.int32),
-			'swdep': np.zeros(traces_amount, dtype=np.int32),
-			'gwdep': np.zeros(traces_amount, dtype=np.int32),
-			'scalel': np.zeros(traces_amount, dtype=np.int16),
-			'scalco': np.zeros(traces_amount, dtype=np.int16),
-			'sx': np.zeros(traces_amount, dtype=np.int32),
-			'sy': np.zeros(traces_amount, dtype=np.int32),
-			'gx': np.zeros(traces_amount, dtype=np.int32),
-			'gy': np.zeros(traces_amount, dtype=np.int32),
-			'counit': np.zeros(traces_amount, dtype=np.int16),
-			'wevel': np.zeros(traces_amount, dtype=np.int16),
-			'swevel': np.zeros(traces_amount, dtype=np.int16),
-			'sut': np.zeros(traces_amount, dtype=np.int16),
-			'gut': np.zeros(traces_amount, dtype=np.int16),
-			'sstat': np.zeros(traces_amount, dtype=np.int16),
-			'gstat': np.zeros(traces_amount, dtype=np.int16),
-			'tstat': np.zeros(traces_amount, dtype=np.int16),
-			'laga': np.zeros(traces_amount, dtype=np.int16),
-			'lagb': np.zeros(traces_amount, dtype=np.int16),
-			'delrt': np.zeros(traces_amount, dtype=np.int16),
-			'muts': np.zeros(traces_amount, dtype=np.int16),
-			'mute': np.zeros(traces_amount, dtype=np.int16),
-			'ns': np.zeros(traces_amount, dtype=np.uint16),
-			'dt': np.zeros(traces_amount, dtype=np.uint16),
-			'gain': np.zeros(traces_amount, dtype=np.int16),
-			'igc': np.zeros(traces_amount, dtype=np.int16),
-			'igi': np.zeros(traces_amount, dtype=np.int16),
-			'corr': np.zeros(traces_amount, dtype=np.int16),
-			'sfs': np.zeros(traces_amount, dtype=np.int16),
-			'sfe': np.zeros(traces_amount, dtype=np.int16),
-			'slen': np.zeros(traces_amount, dtype=np.int16),
-			'styp': np.zeros(traces_amount, dtype=np.int16),
-			'stas': np.zeros(traces_amount, dtype=np.int16),
-			'stae': np.zeros(traces_amount, dtype=np.int16),
-			'tatyp': np.zeros(traces_amount, dtype=np.int16),
-			'afilf': np.zeros(traces_amount, dtype=np.int16),
-			'afils': np.zeros(traces_amount, dtype=np.int16),
-			'nofilf': np.zeros(traces_amount, dtype=np.int16),
-			'nofils': np.zeros(traces_amount, dtype=np.int16),
-			'lcf': np.zeros(traces_amount, dtype=np.int16),
-			'hcf': np.zeros(traces_amount, dtype=np.int16),
-			'lcs': np.zeros(traces_amount, dtype=np.int16),
-			'hcs': np.zeros(traces_amount, dtype=np.int16),
-			'year': np.zeros(traces_amount, dtype=np.int16),
-			'day': np.zeros(traces_amount, dtype=np.int16),
-			'hour': np.zeros(traces_amount, dtype=np.int16),
-			'minute': np.zeros(traces_amount, dtype=np.int16),
-			'sec': np.zeros(traces_amount, dtype=np.int16),
-			'timbas': np.zeros(traces_amount, dtype=np.int16),
-			'trwf': np.zeros(traces_amount, dtype=np.int16),
-			'grnors': np.zeros(traces_amount, dtype=np.int16),
-			'grnofr': np.zeros(traces_amount, dtype=np.int16),
-			'grnlof': np.zeros(traces_amount, dtype=np.int16),
-			'gaps': np.zeros(traces_amount, dtype=np.int16),
-			'otrav': np.zeros(traces_amount, dtype=np.int16),
-			'd1': np.zeros(traces_amount, dtype=np.float32),
-			'f1': np.zeros(traces_amount, dtype=np.float32),
-			'd2': np.zeros(traces_amount, dtype=np.float32),
-			'f2': np.zeros(traces_amount, dtype=np.float32),
-			'ungpow': np.zeros(traces_amount, dtype=np.float32),
-			'unscale': np.zeros(traces_amount, dtype=np.float32),
-			'ntr': np.zeros(traces_amount, dtype=np.int32),
-			'mark': np.zeros(traces_amount, dtype=np.int16),
-			'shortpad': np.zeros(traces_amount, dtype=np.int16)
-		}
+	def trace_dtype(trace_samples_amount, byteorder='<'):
+		# One on-disk trace: 240-byte header followed by float32 samples, in
+		# the given byte order ('<' little-endian, '>' big-endian)
+		return np.dtype([
+			('header', HEADER_DTYPE.newbyteorder(byteorder)),
+			('data', f'{byteorder}f4', (trace_samples_amount,)),
+		])
+
+	@staticmethod
+	def check_byteorder(byteorder):
+		# '<' or '>' for the byte orders accepted by the writers
+		byteorders = {'<': '<', 'little': '<', '>': '>', 'big': '>'}
+		try:
+			return byteorders[byteorder]
+		except (KeyError, TypeError):
+			raise ValueError(
+				f"Unknown byte order {byteorder!r}, expected '<', '>', 'little' or 'big'"
+			) from None
+
+	@staticmethod
+	def is_header_dtype(dtype):
+		# Whether dtype is that of whole SU header records, in any byte order
+		return dtype.names is not None and dtype.newbyteorder('<') == HEADER_DTYPE
+
+	@staticmethod
+	def get_chunk_traces(trace_size):
+		# How many whole traces fit in a single bulk read/write
+		return max(1, IO_CHUNK_SIZE // trace_size)
+
+	@staticmethod
+	def pread_into(file_descriptor, buffer, offset):
+		# Fill buffer from a file position without moving the file offset,
+		# so several threads can read the same open file
+		view = memoryview(buffer).cast('B')
+		total = 0
+		while total < len(view):
+			if hasattr(os, 'preadv'):
+				count = os.preadv(file_descriptor, [view[total:]], offset + total)
+			else:
+				data = os.pread(file_descriptor, len(view) - total, offset + total)
+				count = len(data)
+				view[total:total + count] = data
+			if not count:
+				raise EOFError(f'Expected {len(view)} bytes, got {total}')
+			total += count
+		return buffer
+
+	@staticmethod
+	def take_traces(traces_data, trace_indices):
+		# Copy the given traces (columns) out of a (ns, ntr) matrix. For
+		# memory-mapped data, runs of consecutive traces are copied as single
+		# slices, so the file is read as a few contiguous ranges
+		if not isinstance(traces_data, np.memmap) or len(trace_indices) == 0:
+			return np.asarray(traces_data[:, trace_indices])
+
+		out = np.empty((traces_data.shape[0], len(trace_indices)), dtype=traces_data.dtype)
+		for run_start, run_stop in zip(*Utils.trace_runs(trace_indices)):
+			first = int(trace_indices[run_start])
+			out[:, run_start:run_stop] = traces_data[:, first:first + run_stop - run_start]
+		return out
+
+	@staticmethod
+	def trace_runs(trace_indices):
+		# Runs of consecutive traces in a list of trace indices, as lists of
+		# the (start, stop) positions of each run in trace_indices, so each
+		# run can be read as a single slice starting at trace_indices[start]
+		if len(trace_indices) == 0:
+			return [], []
+		run_starts = np.flatnonzero(np.diff(trace_indices) != 1) + 1
+		run_starts = [0] + run_starts.tolist()
+		run_stops = run_starts[1:] + [len(trace_indices)]
+		return run_starts, run_stops
+
+	@staticmethod
+	def read_into(file, buffer):
+		# Fill buffer from the current stream position, as readinto may
+		# return short counts on raw streams
+		view = memoryview(buffer).cast('B')
+		total = 0
+		while total < len(view):
+			count = file.readinto(view[total:])
+			if not count:
+				raise EOFError(f'Expected {len(view)} bytes, got {total}')
+			total += count
+		return buffer
+
+	@staticmethod
+	def copy_records(destination, source):
+		# Copy structured records of the same dtype as raw bytes, which is
+		# much faster than NumPy's field-by-field structured assignment.
+		# Records of the same fields in another byte order are assigned, so
+		# NumPy swaps each field as it copies it
+		if destination.dtype != source.dtype:
+			destination[...] = source
+			return
+		raw_dtype = np.dtype((np.void, source.dtype.itemsize))
+		destination.view(raw_dtype)[...] = source.view(raw_dtype)
 
-		return header
+	@staticmethod
+	def new_empty_header(traces_amount):
+		# Zeroed header columns, as field views of one structured array of
+		# SU header records
+		records = np.zeros(traces_amount, dtype=HEADER_DTYPE)
+		return {key: records[key] for key in HEADER_DTYPE.names}
@@ -2,4 +2,11 @@ from .services.readsu import readsu
 from .services.readsuInMemory import readsuInMemory
 from .services.writesu import writesu
 from .services.writesuInMemory import writesuInMemory
+from .services.writesuz import writesuz
+from .services.iter_gathers import iter_gathers
+from .services.indexsu import indexsu
+from .services.sortsu import sortsu
+from .Models.SuWriterModel import SuWriter
+from .Models.SuDatasetModel import SuDataset
+from .Models.IOStatsModel import IOStats
 from .constants.__version__ import __version__
@@ -0,0 +1,44 @@
+import re
+import struct
+import numpy as np
+
+from .HEADER_FORMAT_STRING import HEADER_FORMAT_STRING
+from .HEADER_KEYS import HEADER_KEYS
+from .TRACE_HEADER_SIZE import TRACE_HEADER_SIZE
+
+
+def _header_field_codes(format_string):
+    # Expand '<7i4h...' into one struct code per header key
+    codes = []
+    for count, code in re.findall(r'(\d*)([a-zA-Z])', format_string[1:]):
+        codes.extend(code * int(count or 1))
+    return codes
+
+
+def _header_dtype(format_string, keys):
+    byte_order = format_string[0]
+    names = list(keys)
+    formats = []
+    offsets = []
+    offset = 0
+    for code in _header_field_codes(format_string):
+        formats.append(f'{byte_order}{code}')
+        offsets.append(offset)
+        offset += struct.calcsize(f'{byte_order}{code}')
+
+    # The unassigned shorts that complete the 240-byte header are a field
+    # too, so that copying records copies every header byte
+    names.append('unass')
+    formats.append((f'{byte_order}i2', ((TRACE_HEADER_SIZE - offset) // 2,)))
+    offsets.append(offset)
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': TRACE_HEADER_SIZE,
+    })
+
+
+# Structured dtype of a whole 240-byte trace header: the fields of
+# HEADER_FORMAT_STRING followed by the unassigned bytes (unass)
+HEADER_DTYPE = _header_dtype(HEADER_FORMAT_STRING, HEADER_KEYS)
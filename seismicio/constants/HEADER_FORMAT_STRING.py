@@ -1 +1 @@
-HEADER_FORMAT_STRING = '<7i4h8i2h4i13h2H31h6f'
+HEADER_FORMAT_STRING = '<7i4h8i2h4i13h2H31h6fi2h'
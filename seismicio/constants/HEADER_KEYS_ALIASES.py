@@ -8,5 +8,6 @@ HEADER_KEYS_ALIASES = (
     'stae', 'tatyp', 'afilf', 'afils', 'nofilf', 'nofils', 'lcf',
     'hcf', 'lcs', 'hcs', 'year', 'day', 'hour', 'minute', 'sec',
     'timbas', 'trwf', 'grnors', 'grnofr', 'grnlof', 'gaps', 'otrav',
-    'd1', 'f1', 'd2', 'f2', 'ungpow', 'unscale'
+    'd1', 'f1', 'd2', 'f2', 'ungpow', 'unscale', 'ntr', 'mark',
+    'shortpad'
 )
\ No newline at end of file
@@ -0,0 +1 @@
+IO_CHUNK_SIZE = 64 * 1024 * 1024  # in bytes, per bulk read/write
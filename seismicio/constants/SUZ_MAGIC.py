@@ -0,0 +1 @@
+SUZ_MAGIC = b'\x89SUZ\r\n\x1a\n'  # first bytes of a compressed SU container
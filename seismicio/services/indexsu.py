@@ -0,0 +1,24 @@
+from ..Models.InOutSuModel import InOutSu
+from ..Models.GatherIndexModel import GatherIndex
+from ..Models.SuzModel import Suz
+
+def indexsu(file_path, gather_keywords, sort=False):
+	# Build the gather indices of several header keywords in a single pass
+	# over a .su file and store them in its sidecar index file
+	# With sort=True, indices are built through a sort permutation, for
+	# keywords the file is not sorted by
+	# For compressed SU containers, only the columns of the keywords are
+	# decompressed
+	with open(file_path, 'rb') as file:
+		if Suz.is_suz(file):
+			header_records = Suz.unpack_suz_headers(file, gather_keywords)
+		else:
+			header_records = None
+	if header_records is None:
+		header_records = InOutSu.map_su_headers(file_path, gather_keywords)
+	gather_indices = {
+		gather_keyword: GatherIndex.from_keys(header_records[gather_keyword], sort)
+		for gather_keyword in gather_keywords
+	}
+	GatherIndex.save(file_path, gather_indices)
+	return gather_indices
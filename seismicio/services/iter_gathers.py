@@ -0,0 +1,15 @@
+from ..Models.InOutSuModel import InOutSu
+from ..Models.SuzModel import Suz
+
+def iter_gathers(file_path, gather_keyword=None, chunk_traces=None, mem_fs=None, order='C'):
+	# Stream a binary file in .su format gather by gather, keeping at most
+	# one read block plus the largest gather in memory. Pass mem_fs to read
+	# from an in-memory (pyfilesystem) file system, as in readsuInMemory
+	# Compressed SU containers are streamed too, decompressing only the
+	# chunks of each gather
+	opener = open if mem_fs is None else mem_fs.open
+	with opener(file_path, 'rb') as file:
+		if Suz.is_suz(file):
+			yield from Suz.iter_unpack_suz(file, gather_keyword, chunk_traces, order)
+		else:
+			yield from InOutSu.iter_unpack_su(file, gather_keyword, chunk_traces, order)
@@ -1,6 +1,111 @@
+import os
 from ..Models.InOutSuModel import InOutSu
+from ..Models.GatherIndexModel import GatherIndex
+from ..Models.SuDataModel import Header
+from ..Models.SuzModel import Suz
+from ..Models.IOStatsModel import IOStats
 
-def readsu(file_path, gather_keyword=None):
+def readsu(
+	file_path,
+	gather_keyword=None,
+	mmap=False,
+	writable=False,
+	sidecar=False,
+	sort=False,
+	headers_only=False,
+	keys=None,
+	order='C',
+	workers=1,
+	sample_range=None,
+	trace_range=None,
+	trace_step=1,
+	stats=None,
+):
 	# Read a binary file in .su format
-	with open(file_path, 'rb') as file:
-		return InOutSu.unpack_su(file, gather_keyword)
+	# With order='F', the (ns, ntr) data is stored trace by trace (Fortran
+	# order), so each trace and each gather is a contiguous block. Mapped
+	# files (mmap=True) always keep the on-disk trace-major layout
+	# With workers > 1, the file is read by that many threads at once, each
+	# filling its own range of traces (same result as a serial read)
+	# With headers_only=True, only the headers are read, and a Header is
+	# returned instead of an SuFile (no trace data). If `keys` is given, only
+	# those header keys are decoded
+	# Compressed SU containers (written by writesuz) are detected by their
+	# first bytes and opened with the same options; with mmap=True, the
+	# data is decompressed chunk by chunk as it is accessed
+	# Big-endian files are detected from their ns and dt headers and read
+	# the same way: samples and headers are swapped as they are copied, or
+	# as they are accessed with mmap=True (no copy of the file is made)
+	# With stats (an IOStats), per-phase timings and byte counts of the
+	# read are added to it, and the returned SuFile keeps it as io_stats
+	stats = IOStats.get(stats)
+	with stats.phase('total'):
+		with open(file_path, 'rb') as file:
+			is_suz = Suz.is_suz(file)
+			if is_suz and headers_only:
+				return Header(Suz.unpack_suz_headers(file, keys, stats=stats))
+		if is_suz:
+			# The window, writable and workers options depend on the layout
+			# of .su files, so they are rejected rather than ignored
+			unsupported = [
+				name
+				for name, used in (
+					('writable', writable),
+					('workers', workers > 1),
+					('sample_range', sample_range is not None),
+					('trace_range', trace_range is not None),
+					('trace_step', trace_step != 1),
+				)
+				if used
+			]
+			if unsupported:
+				raise ValueError(
+					f"readsu options not supported for compressed SU containers: {', '.join(unsupported)}"
+				)
+
+		if headers_only:
+			return Header(InOutSu.map_su_headers(file_path, keys, stats))
+
+		# With sample_range, trace_range or trace_step, only a window of the file
+		# is read: samples sample_range[0] to sample_range[1] of every
+		# trace_step-th trace from trace_range[0] to trace_range[1] (half-open, as
+		# Python slices). The ns and delrt headers are updated to the window
+		if sample_range is not None or trace_range is not None or trace_step != 1:
+			return InOutSu.unpack_su_window(
+				file_path, sample_range, trace_range, trace_step, gather_keyword, sort, order, stats
+			)
+
+		# With sort=True, gathers are grouped through a sort permutation, so the
+		# file does not need to be sorted by gather_keyword
+		# With sidecar=True, the gathers of gather_keyword are taken from the
+		# index file next to the .su file, which is (re)built when missing or stale
+		gather_index = None
+		if sidecar and gather_keyword is not None:
+			with stats.phase('gather_index'):
+				gather_index = GatherIndex.load(file_path, gather_keyword, sort)
+
+		if is_suz:
+			# With mmap=True, the container stays open and its chunks are
+			# decompressed as they are accessed
+			file = open(file_path, 'rb')
+			try:
+				sufile = Suz.unpack_suz(file, gather_keyword, sort, order, mmap, stats, gather_index)
+			finally:
+				if not mmap:
+					file.close()
+		elif mmap:
+			# Map the file instead of loading it; with writable=True, in-place
+			# edits of data and headers are written back to the file
+			sufile = InOutSu.map_su(file_path, gather_keyword, writable, gather_index, sort, stats)
+		elif workers > 1 and hasattr(os, 'pread'):
+			# Fill the arrays from several threads with positional reads
+			sufile = InOutSu.unpack_su_parallel(
+				file_path, workers, gather_keyword, gather_index, sort, order, stats
+			)
+		else:
+			with open(file_path, 'rb') as file:
+				sufile = InOutSu.unpack_su(file, gather_keyword, gather_index, sort, order, stats)
+
+		if sidecar and gather_keyword is not None and gather_index is None:
+			GatherIndex.try_save(file_path, {gather_keyword: sufile.gather_index})
+		return sufile
@@ -1,7 +1,23 @@
 from ..Models.InOutSuModel import InOutSu
+from ..Models.SuDataModel import Header
+from ..Models.SuzModel import Suz
+from ..Models.IOStatsModel import IOStats
 
-def readsuInMemory(mem_fs, file_path):
+def readsuInMemory(mem_fs, file_path, order='C', stats=None, headers_only=False, keys=None):
 	# Read a binary file in .su format
 	# from in-memory temporary file system
-	with mem_fs.open(file_path, 'rb') as file:
-		return InOutSu.unpack_su(file)
+	# Compressed SU containers are detected and read as well
+	# With stats (an IOStats), per-phase timings and byte counts of the
+	# read are added to it, and the returned SuFile keeps it as io_stats
+	# With headers_only=True, only the headers are decoded, and a Header is
+	# returned instead of an SuFile (no trace data). If `keys` is given, only
+	# those header keys are decoded
+	with IOStats.get(stats).phase('total'):
+		with mem_fs.open(file_path, 'rb') as file:
+			if Suz.is_suz(file):
+				if headers_only:
+					return Header(Suz.unpack_suz_headers(file, keys, stats=stats))
+				return Suz.unpack_suz(file, order=order, stats=stats)
+			if headers_only:
+				return Header(InOutSu.unpack_su_headers(file, keys, stats))
+			return InOutSu.unpack_su(file, order=order, stats=stats)
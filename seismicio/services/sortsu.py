@@ -0,0 +1,15 @@
+from ..Models.ExternalSortModel import ExternalSort
+
+def sortsu(in_path, out_path, keys, memory_limit=None, sidecar=False):
+	# Write the traces of a .su file sorted by the given header keys (e.g.
+	# ['cdp', 'offset']) to a new file, without loading the whole file
+	# Only the headers are scanned to sort; the traces are then copied in
+	# blocks, reading each run of consecutive traces at once. Traces with
+	# equal keys keep their input order. The output has the byte order of
+	# the input file
+	# memory_limit bounds the bytes used for the key index and the copy
+	# blocks; when the key index does not fit, it is sorted in runs spilled
+	# to temporary files next to out_path and merged
+	# With sidecar=True, the gather index of the first key in the new order
+	# is stored in the sidecar index file of out_path
+	return ExternalSort.run(in_path, out_path, keys, memory_limit, sidecar)
@@ -1,7 +1,13 @@
 from ..Models.InOutSuModel import InOutSu
+from ..Models.IOStatsModel import IOStats
 
-def writesu(file_path, traces_data, hdr):
+def writesu(file_path, traces_data, hdr, stats=None, byteorder='<'):
 	# Write a binary file in .su format
-	with open(file_path, 'wb') as file:
-		InOutSu.pack_and_save_su(file, traces_data, hdr)
-	pass
+	# With stats (an IOStats), per-phase timings and byte counts of the
+	# write are added to it, and it is returned
+	# byteorder is the byte order of the file: '<' or 'little' (default),
+	# '>' or 'big' (as written by SU on big-endian machines)
+	with IOStats.get(stats).phase('total'):
+		with open(file_path, 'wb') as file:
+			InOutSu.pack_and_save_su(file, traces_data, hdr, stats, byteorder)
+	return stats
@@ -1,8 +1,13 @@
 from ..Models.InOutSuModel import InOutSu
+from ..Models.IOStatsModel import IOStats
 
-def writesuInMemory(mem_fs, file_path, traces_data, hdr):
+def writesuInMemory(mem_fs, file_path, traces_data, hdr, stats=None, byteorder='<'):
 	# Write a binary file in .su format
 	# at in-memory temporary file system
-	with mem_fs.open(file_path, 'wb') as file:
-		InOutSu.pack_and_save_su(file, traces_data, hdr)
-	pass
+	# With stats (an IOStats), per-phase timings and byte counts of the
+	# write are added to it, and it is returned
+	# byteorder is the byte order of the file, as in writesu
+	with IOStats.get(stats).phase('total'):
+		with mem_fs.open(file_path, 'wb') as file:
+			InOutSu.pack_and_save_su(file, traces_data, hdr, stats, byteorder)
+	return stats
@@ -0,0 +1,27 @@
+from ..Models.SuzModel import Suz
+from ..Models.IOStatsModel import IOStats
+
+def writesuz(
+	file_path,
+	traces_data,
+	hdr,
+	gather_keyword=None,
+	codec='zlib',
+	level=None,
+	chunk_traces=None,
+	stats=None,
+):
+	# Write a compressed SU container, which readsu opens like a .su file
+	# Samples are compressed in independent chunks: one per gather of
+	# gather_keyword (traces must be sorted by it), or one per chunk_traces
+	# traces (about 1 MiB of samples by default), so that reading a gather
+	# only decompresses its own chunks
+	# codec is 'zlib' or 'lzma', with its compression level (or preset)
+	# With stats (an IOStats), per-phase timings and byte counts of the
+	# write are added to it, and it is returned
+	with IOStats.get(stats).phase('total'):
+		with open(file_path, 'wb') as file:
+			Suz.pack_and_save_suz(
+				file, traces_data, hdr, gather_keyword, codec, level, chunk_traces, stats
+			)
+	return stats